@@ -1,203 +1,434 @@
 import aiohttp
 from aiohttp import web
 import asyncio
-import json
+import orjson
 import os
+import shlex
 import subprocess
 
 # --- Configuration ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TOOLS_DIR = os.path.join(BASE_DIR, 'tools')
+TOOL_EXTENSIONS = ('.py', '.bat', '.ps1')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
+LLM_API_URL = "http://192.168.1.163:5002/v1/chat/completions"
+LLM_MODEL_NAME = "koboldcpp"
+TOOL_RUNNER = os.path.join(BASE_DIR, 'tool_runner.py')
+TOOL_WORKERS = 2
+TOOL_WORKER_LINE_LIMIT = 64 * 1024 * 1024
+MAX_TOOL_OUTPUT = 1024 * 1024  # UTF-8 bytes kept per stream (stdout/stderr) of a tool run, on both the worker and subprocess paths
+STREAM_FLUSH_BYTES = 4096
+STREAM_FLUSH_SECONDS = 0.015
+STREAM_READ_BUFSIZE = 256 * 1024
+# Caps the chat/decision requests this server holds open upstream; past that,
+# callers wait here and get a "queued" notice. Tools that call the LLM themselves
+# (web-search-tool.py, gather-market-data.py) bypass it, so total upstream load can exceed this.
+LLM_MAX_CONCURRENT = 4
+LLM_QUEUED_NOTICE_SECONDS = 0.2
+STATIC_MAX_AGE = 3600
+
+# --- Prompts ---
+
+DECISION_SYSTEM_PROMPT = "You are a financial market analysis assistant with access to real-time market data functions and mandatory web search capabilities. CRITICAL REQUIREMENT: You must ALWAYS use the websearch feature available through this API endpoint before analyzing any market data or providing financial insights. Your training data is outdated for financial markets, which change by the second, so web search is mandatory for accuracy. OPERATIONAL FLOW: 1. MANDATORY WEB SEARCH FIRST: Before calling any market data functions, you must search the web using the 'single' mode for current market conditions, breaking financial news, economic events, and relevant developments that could impact your analysis. Search for terms like current market news, breaking financial news, economic updates, Fed announcements, earnings reports, geopolitical events affecting markets. 2. FUNCTION CALLING SEQUENCE: After web search, call the provided market data functions in this logical order: get_market_indices first, then get_sector_performance, then get_economic_indicators, then calculate_market_sentiment with the market data, and finally generate_market_summary with all collected data. 3. CONTEXTUAL ANALYSIS: Combine the current web search results with the function data to provide comprehensive analysis. Reference specific news events, policy changes, earnings announcements, or economic developments found in your web search when interpreting the numerical data from functions. 4. CURRENT EVENT INTEGRATION: Your analysis must reflect real-time market drivers found through web search. If your web search reveals significant news like Federal Reserve decisions, major earnings beats or misses, geopolitical tensions, economic data releases, or corporate announcements, prominently feature these in your analysis and explain how they relate to the market data. 5. ACCURACY PRIORITY: If web search results contradict or provide additional context to the function data, prioritize the most recent and credible information. Always cite your web sources when referencing current events or recent developments. RESPONSE STRUCTURE: Begin with a brief mention of key current events from your web search, present the quantitative analysis from the functions, then synthesize both into actionable insights. Always acknowledge the time-sensitive nature of financial markets and that conditions can change rapidly. Remember: Financial markets are extremely time-sensitive. What happened even hours ago can be outdated. Web search is not optional - it is mandatory for providing accurate, current financial analysis."
+# Built once; the message dict is shared read-only across requests.
+DECISION_SYSTEM_MESSAGE = {"role": "system", "content": DECISION_SYSTEM_PROMPT}
+
+# --- Application Lifecycle ---
+
+async def create_http_session(app):
+    """Creates the shared ClientSession so LLM calls reuse pooled keep-alive connections."""
+    connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=300, keepalive_timeout=75)
+    # No total cap: long generations stream for minutes; only fail fast on connect.
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+    app['http_session'] = aiohttp.ClientSession(
+        connector=connector, timeout=timeout, json_serialize=json_dumps, read_bufsize=STREAM_READ_BUFSIZE
+    )
+    app['llm_semaphore'] = asyncio.Semaphore(LLM_MAX_CONCURRENT)
+
+async def close_http_session(app):
+    """Closes the shared ClientSession on shutdown."""
+    await app['http_session'].close()
+
+async def start_tool_workers(app):
+    """Pre-spawns the pool of long-lived tool_runner.py workers."""
+    pool = asyncio.Queue()
+    for _ in range(TOOL_WORKERS):
+        pool.put_nowait(await spawn_tool_worker())
+    app['tool_workers'] = pool
+
+async def stop_tool_workers(app):
+    """Terminates idle tool workers on shutdown."""
+    pool = app['tool_workers']
+    while not pool.empty():
+        worker = pool.get_nowait()
+        if worker is not None and worker.returncode is None:
+            worker.kill()
+            await worker.wait()
+
+# --- Tool Execution ---
+
+async def spawn_tool_worker():
+    """Starts one tool_runner.py worker process speaking line-delimited JSON over stdin/stdout."""
+    return await asyncio.create_subprocess_exec(
+        'python', TOOL_RUNNER,
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        limit=TOOL_WORKER_LINE_LIMIT
+    )
+
+def mark_truncated(text, truncated):
+    """Appends a visible marker to output that was cut at MAX_TOOL_OUTPUT."""
+    if not truncated:
+        return text
+    return f"{text}\n[... output truncated at {MAX_TOOL_OUTPUT} bytes]"
+
+def utf8_prefix(data, limit):
+    """Cuts data to at most limit bytes, backing off so a multi-byte UTF-8 sequence is never split."""
+    if len(data) <= limit:
+        return data
+    cut = limit
+    while cut > limit - 3 and cut > 0 and (data[cut] & 0xC0) == 0x80:
+        cut -= 1
+    return data[:cut]
+
+async def read_capped(stream, limit=MAX_TOOL_OUTPUT):
+    """Reads a pipe to EOF, keeping at most limit bytes and draining the rest so the child never blocks."""
+    # Keep a few bytes past the limit so utf8_prefix can see where the cut lands.
+    keep = limit + 3
+    buffer = bytearray()
+    while chunk := await stream.read(64 * 1024):
+        room = keep - len(buffer)
+        if room > 0:
+            buffer += chunk[:room]
+    truncated = len(buffer) > limit
+    # FIX: Decode with error handling to prevent crashes
+    return mark_truncated(utf8_prefix(buffer, limit).decode('utf-8', errors='replace'), truncated)
+
+async def run_tool_process(command, timeout=None):
+    """Runs a tool as its own subprocess and returns (returncode, stdout, stderr)."""
+    proc = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    async def collect():
+        output = await asyncio.gather(read_capped(proc.stdout), read_capped(proc.stderr))
+        await proc.wait()
+        return output
+
+    try:
+        stdout, stderr = await asyncio.wait_for(collect(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        raise
+    return proc.returncode, stdout, stderr
+
+async def run_python_tool(app, script_path, args, timeout=None):
+    """Runs a Python tool in a pooled worker, falling back to a fresh subprocess when all workers are busy."""
+    pool = app['tool_workers']
+    try:
+        worker = pool.get_nowait()
+    except asyncio.QueueEmpty:
+        return await run_tool_process(['python', script_path] + args, timeout=timeout)
+
+    try:
+        if worker is None or worker.returncode is not None:
+            worker = await spawn_tool_worker()
+        request = {"script": script_path, "args": args, "max_output": MAX_TOOL_OUTPUT}
+        worker.stdin.write(orjson.dumps(request) + b'\n')
+        await worker.stdin.drain()
+        line = await asyncio.wait_for(worker.stdout.readline(), timeout=timeout)
+        if not line:
+            raise RuntimeError("Tool worker exited unexpectedly.")
+        result = orjson.loads(line)
+        truncated = result.get('truncated', {})
+        return (result['returncode'],
+                mark_truncated(result['stdout'], truncated.get('stdout')),
+                mark_truncated(result['stderr'], truncated.get('stderr')))
+    except BaseException:
+        # A worker abandoned mid-request may still be running the tool; discard it
+        # and let the next caller spawn a replacement.
+        if worker is not None and worker.returncode is None:
+            worker.kill()
+        worker = None
+        raise
+    finally:
+        pool.put_nowait(worker)
+
+# --- Streaming Helpers ---
+
+async def iter_coalesced(reader, max_bytes=STREAM_FLUSH_BYTES, max_delay=STREAM_FLUSH_SECONDS):
+    """Yields upstream bytes in batches, flushing at max_bytes or max_delay seconds after the first buffered byte."""
+    loop = asyncio.get_running_loop()
+    buffer = bytearray()
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(deadline - loop.time(), 0)
+        try:
+            chunk = await asyncio.wait_for(reader.readany(), timeout)
+        except asyncio.TimeoutError:
+            yield bytes(buffer)
+            buffer.clear()
+            deadline = None
+            continue
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) >= max_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+            deadline = None
+        elif deadline is None:
+            deadline = loop.time() + max_delay
+    if buffer:
+        yield bytes(buffer)
+
+def sse_error_frame(message):
+    """Builds an SSE error event followed by the [DONE] terminator the client expects."""
+    return b'data: ' + orjson.dumps({"error": message}) + b'\n\ndata: [DONE]\n\n'
+
+# --- JSON Responses ---
+
+def json_dumps(obj):
+    """Serializes response bodies with orjson; aiohttp expects a str back."""
+    return orjson.dumps(obj).decode()
+
+def json_response(data, **kwargs):
+    """web.json_response using orjson for the body."""
+    return web.json_response(data, dumps=json_dumps, **kwargs)
+
+# --- Tool Metadata Cache ---
+
+_tool_names_cache = (None, frozenset())
+_tool_metadata_cache = {}
+
+def get_tool_names():
+    """Returns the set of runnable tool file names, re-listing TOOLS_DIR only when its mtime changes."""
+    global _tool_names_cache
+    mtime = os.stat(TOOLS_DIR).st_mtime_ns
+    if mtime != _tool_names_cache[0]:
+        names = frozenset(f for f in os.listdir(TOOLS_DIR) if f.endswith(TOOL_EXTENSIONS))
+        _tool_names_cache = (mtime, names)
+    return _tool_names_cache[1]
+
+def _unquote(token):
+    """Strips one pair of matching quotes wrapping a whole token."""
+    if len(token) >= 2 and token[0] == token[-1] and token[0] in '"\'':
+        return token[1:-1]
+    return token
+
+def split_tool_args(args_string):
+    """
+    Splits a tool argument string on whitespace, keeping "quoted phrases" together.
+    Non-POSIX shlex leaves apostrophes inside words ("what's") and backslashes in
+    Windows paths untouched; only quotes wrapping a whole token are removed.
+    Unbalanced quotes fall back to a plain whitespace split.
+    """
+    try:
+        return [_unquote(token) for token in shlex.split(args_string, posix=False)]
+    except ValueError:
+        # e.g. a leading apostrophe with no partner: "'tis the season"
+        return args_string.split()
+
+async def run_tool_metadata(app, script_path, flag):
+    """Runs a tool with a metadata flag and returns its parsed JSON output, or None if it has none."""
+    returncode, stdout, stderr = await run_python_tool(app, script_path, [flag])
+    if returncode != 0:
+        return None
+    try:
+        return orjson.loads(stdout)
+    except orjson.JSONDecodeError:
+        return None
+
+async def get_tool_metadata(app, script_path, flag):
+    """Returns a tool's '--get-options'/'--get-definition' output, re-running it only when the file changes."""
+    stat = os.stat(script_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _tool_metadata_cache.get((script_path, flag))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    metadata = await run_tool_metadata(app, script_path, flag)
+    _tool_metadata_cache[(script_path, flag)] = (signature, metadata)
+    return metadata
 
 # --- Route Handlers ---
 
 async def index(request):
     """Serves the main index.html file."""
-    return web.FileResponse(os.path.join(STATIC_DIR, 'index.html'))
+    response = web.FileResponse(os.path.join(STATIC_DIR, 'index.html'), chunk_size=64 * 1024)
+    response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}'
+    return response
 
 async def get_tools(request):
     """Scans the tools directory for .py, .bat, and .ps1 files."""
     try:
         if not os.path.exists(TOOLS_DIR):
-            return web.json_response([])
-        
-        compatible_extensions = ('.py', '.bat', '.ps1')
-        tool_files = [f for f in os.listdir(TOOLS_DIR) if f.endswith(compatible_extensions)]
-        return web.json_response(tool_files)
+            return json_response([])
+
+        return json_response(sorted(get_tool_names()))
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return json_response({"error": str(e)}, status=500)
 
 async def get_tool_options(request):
     """Runs a tool with '--get-options' to fetch its pre-typed command list for the manual UI."""
     tool_name = request.query.get('tool')
     if not tool_name:
-        return web.json_response({"error": "Tool name parameter is missing."}, status=400)
+        return json_response({"error": "Tool name parameter is missing."}, status=400)
 
+    if tool_name not in get_tool_names():
+        return json_response({"error": "Tool not found."}, status=404)
     script_path = os.path.join(TOOLS_DIR, tool_name)
-    if not os.path.isfile(script_path):
-        return web.json_response({"error": "Tool not found."}, status=404)
 
     try:
-        command = ['python', script_path, '--get-options']
-        proc = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
-
-        if proc.returncode != 0:
-            return web.json_response([])
-
-        # FIX: Decode with error handling to prevent crashes
-        options = json.loads(stdout.decode('utf-8', errors='replace'))
-        return web.json_response(options)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return web.json_response([])
+        options = await get_tool_metadata(request.app, script_path, '--get-options')
+        return json_response(options if options is not None else [])
+    except FileNotFoundError:
+        return json_response([])
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return json_response({"error": str(e)}, status=500)
 
 async def call_tool(request):
     """Handles the MANUAL execution of a tool, intelligently choosing the interpreter."""
-    data = await request.json()
+    data = await request.json(loads=orjson.loads)
     tool_name = data.get('tool')
     args_string = data.get('args', '')
 
     if not tool_name:
-        return web.json_response({"error": "Invalid tool name specified."}, status=400)
+        return json_response({"error": "Invalid tool name specified."}, status=400)
 
+    if tool_name not in get_tool_names():
+        return json_response({"error": "Tool not found."}, status=404)
     script_path = os.path.join(TOOLS_DIR, tool_name)
-    if not os.path.isfile(script_path):
-        return web.json_response({"error": "Tool not found."}, status=404)
 
     try:
-        args_list = args_string.split()
+        args_list = split_tool_args(args_string)
         file_ext = os.path.splitext(tool_name)[1].lower()
         
-        command = []
         if file_ext == '.py':
-            command = ['python', script_path] + args_list
+            returncode, stdout_decoded, stderr_decoded = await run_python_tool(request.app, script_path, args_list, timeout=500)
         elif file_ext == '.bat':
-            command = [script_path] + args_list
+            returncode, stdout_decoded, stderr_decoded = await run_tool_process([script_path] + args_list, timeout=500)
         elif file_ext == '.ps1':
             command = ['powershell.exe', '-ExecutionPolicy', 'Bypass', '-File', script_path] + args_list
+            returncode, stdout_decoded, stderr_decoded = await run_tool_process(command, timeout=500)
         else:
-            return web.json_response({"error": f"Unsupported tool type: {file_ext}"}, status=400)
-
-        proc = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=500)
-
-        # FIX: Decode with error handling to prevent crashes
-        stderr_decoded = stderr.decode('utf-8', errors='replace')
-        stdout_decoded = stdout.decode('utf-8', errors='replace')
+            return json_response({"error": f"Unsupported tool type: {file_ext}"}, status=400)
 
-        if proc.returncode != 0:
-            return web.json_response({"error": f"Tool execution failed:\n{stderr_decoded}"}, status=500)
+        if returncode != 0:
+            return json_response({"error": f"Tool execution failed:\n{stderr_decoded}"}, status=500)
         
-        return web.json_response({"output": stdout_decoded})
+        return json_response({"output": stdout_decoded})
     except asyncio.TimeoutError:
-        return web.json_response({"error": "Tool execution timed out after 500 seconds."}, status=500)
+        return json_response({"error": "Tool execution timed out after 500 seconds."}, status=500)
     except Exception as e:
-        return web.json_response({"error": str(e)}, status=500)
+        return json_response({"error": str(e)}, status=500)
 
 async def decide_and_run_tool(request):
     """Handles the AUTOMATIC 'Smart Action' by asking the AI to choose and run a tool."""
-    data = await request.json()
+    data = await request.json(loads=orjson.loads)
     user_prompt = data.get('prompt')
     if not user_prompt:
-        return web.json_response({"error": "Prompt is missing."}, status=400)
-
-    tool_definitions = []
-    for tool_file in os.listdir(TOOLS_DIR):
-        if tool_file.endswith('.py'):
-            script_path = os.path.join(TOOLS_DIR, tool_file)
-            try:
-                proc = await asyncio.create_subprocess_exec(
-                    'python', script_path, '--get-definition',
-                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-                )
-                stdout, stderr = await proc.communicate()
-                if proc.returncode == 0:
-                    # FIX: Decode with error handling
-                    tool_definitions.append(json.loads(stdout.decode('utf-8', errors='replace')))
-            except Exception:
-                continue
-
-    model_api_url = "http://192.168.1.163:5002/v1/chat/completions"
-    system_prompt = "You are a financial market analysis assistant with access to real-time market data functions and mandatory web search capabilities. CRITICAL REQUIREMENT: You must ALWAYS use the websearch feature available through this API endpoint before analyzing any market data or providing financial insights. Your training data is outdated for financial markets, which change by the second, so web search is mandatory for accuracy. OPERATIONAL FLOW: 1. MANDATORY WEB SEARCH FIRST: Before calling any market data functions, you must search the web using the 'single' mode for current market conditions, breaking financial news, economic events, and relevant developments that could impact your analysis. Search for terms like current market news, breaking financial news, economic updates, Fed announcements, earnings reports, geopolitical events affecting markets. 2. FUNCTION CALLING SEQUENCE: After web search, call the provided market data functions in this logical order: get_market_indices first, then get_sector_performance, then get_economic_indicators, then calculate_market_sentiment with the market data, and finally generate_market_summary with all collected data. 3. CONTEXTUAL ANALYSIS: Combine the current web search results with the function data to provide comprehensive analysis. Reference specific news events, policy changes, earnings announcements, or economic developments found in your web search when interpreting the numerical data from functions. 4. CURRENT EVENT INTEGRATION: Your analysis must reflect real-time market drivers found through web search. If your web search reveals significant news like Federal Reserve decisions, major earnings beats or misses, geopolitical tensions, economic data releases, or corporate announcements, prominently feature these in your analysis and explain how they relate to the market data. 5. ACCURACY PRIORITY: If web search results contradict or provide additional context to the function data, prioritize the most recent and credible information. Always cite your web sources when referencing current events or recent developments. RESPONSE STRUCTURE: Begin with a brief mention of key current events from your web search, present the quantitative analysis from the functions, then synthesize both into actionable insights. Always acknowledge the time-sensitive nature of financial markets and that conditions can change rapidly. Remember: Financial markets are extremely time-sensitive. What happened even hours ago can be outdated. Web search is not optional - it is mandatory for providing accurate, current financial analysis."
-    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": f"User Request: '{user_prompt}'\n\nAvailable Tools:\n{json.dumps(tool_definitions, indent=2)}"}]
-    llm_payload = {"model": "koboldcpp", "messages": messages, "temperature": 0.0}
+        return json_response({"error": "Prompt is missing."}, status=400)
+
+    tool_files = [f for f in sorted(get_tool_names()) if f.endswith('.py')]
+    definitions = await asyncio.gather(
+        *(get_tool_metadata(request.app, os.path.join(TOOLS_DIR, f), '--get-definition') for f in tool_files),
+        return_exceptions=True
+    )
+    tool_definitions = [d for d in definitions if d is not None and not isinstance(d, Exception)]
+
+    messages = [DECISION_SYSTEM_MESSAGE, {"role": "user", "content": f"User Request: '{user_prompt}'\n\nAvailable Tools:\n{orjson.dumps(tool_definitions).decode()}"}]
+    llm_payload = {"model": LLM_MODEL_NAME, "messages": messages, "temperature": 0.0}
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(model_api_url, json=llm_payload) as response:
-                response.raise_for_status()
-                llm_response = await response.json()
-                decision = json.loads(llm_response['choices'][0]['message']['content'])
+        session = request.app['http_session']
+        async with request.app['llm_semaphore'], session.post(LLM_API_URL, json=llm_payload) as response:
+            response.raise_for_status()
+            llm_response = await response.json(loads=orjson.loads)
+            decision = orjson.loads(llm_response['choices'][0]['message']['content'])
     except Exception as e:
-        return web.json_response({"error": f"LLM decision failed: {str(e)}"}, status=500)
+        return json_response({"error": f"LLM decision failed: {str(e)}"}, status=500)
 
     tool_name = decision.get('tool')
     args_string = decision.get('args', '')
+    if tool_name not in get_tool_names() or not tool_name.endswith('.py'):
+        return json_response({"error": f"LLM chose an unknown tool: {tool_name}"}, status=500)
     script_path = os.path.join(TOOLS_DIR, tool_name)
-    
+
     try:
-        args_list = args_string.split()
-        command = ['python', script_path] + args_list
-        proc = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=500)
-        
-        # FIX: Decode with error handling
-        stderr_decoded = stderr.decode('utf-8', errors='replace')
-        stdout_decoded = stdout.decode('utf-8', errors='replace')
+        args_list = split_tool_args(args_string)
+        returncode, stdout_decoded, stderr_decoded = await run_python_tool(request.app, script_path, args_list, timeout=500)
 
-        if proc.returncode != 0:
-            return web.json_response({"error": f"Tool execution failed:\n{stderr_decoded}"}, status=500)
-        return web.json_response({"output": stdout_decoded, "tool_called": tool_name})
+        if returncode != 0:
+            return json_response({"error": f"Tool execution failed:\n{stderr_decoded}"}, status=500)
+        return json_response({"output": stdout_decoded, "tool_called": tool_name})
     except Exception as e:
-        return web.json_response({"error": f"Tool execution failed after decision: {str(e)}"}, status=500)
+        return json_response({"error": f"Tool execution failed after decision: {str(e)}"}, status=500)
+
+async def prepare_event_stream(request, content_type='text/event-stream'):
+    """Starts a streaming SSE response to the client."""
+    response = web.StreamResponse()
+    response.headers['Content-Type'] = content_type
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Connection'] = 'keep-alive'
+    await response.prepare(request)
+    return response
 
 async def stream(request):
     """Handles the original AI chat streaming functionality."""
+    # The body is relayed to the model as-is; parsing and re-encoding it buys nothing.
+    body = await request.read()
+    semaphore = request.app['llm_semaphore']
+    response = None
+    try:
+        await asyncio.wait_for(semaphore.acquire(), LLM_QUEUED_NOTICE_SECONDS)
+    except asyncio.TimeoutError:
+        # Waiting behind other generations; an SSE comment lets the client know
+        # the request is alive (the client only acts on "data:" lines).
+        response = await prepare_event_stream(request)
+        await response.write(b': queued\n\n')
+        await semaphore.acquire()
+
     try:
-        data = await request.json()
-        model_api_url = "http://192.168.1.163:5002/v1/chat/completions"
-        response = web.StreamResponse()
-        response.headers['Content-Type'] = 'text/event-stream'
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['Connection'] = 'keep-alive'
-        await response.prepare(request)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(model_api_url, json=data) as proxy_response:
-                proxy_response.raise_for_status()
-                async for chunk in proxy_response.content.iter_any():
-                    if chunk:
-                        await response.write(chunk)
-        await response.write_eof()
-        return response
+        session = request.app['http_session']
+        async with session.post(LLM_API_URL, data=body, headers={'Content-Type': 'application/json'}) as proxy_response:
+            proxy_response.raise_for_status()
+            # Open the upstream first so a connect/HTTP error can still be sent
+            # as a normal response; once prepared, bytes pass through as-is.
+            if response is None:
+                response = await prepare_event_stream(
+                    request, proxy_response.headers.get('Content-Type', 'text/event-stream')
+                )
+            async for chunk in iter_coalesced(proxy_response.content):
+                await response.write(chunk)
     except aiohttp.ClientError as e:
-        error_message = {"error": f"Failed to connect to the AI model API: {e}"}
-        error_json = f"data: {json.dumps(error_message)}\n\ndata: [DONE]\n\n"
-        return web.Response(text=error_json, content_type='text/event-stream')
+        if response is None:
+            return web.Response(body=sse_error_frame(f"Failed to connect to the AI model API: {e}"),
+                                content_type='text/event-stream')
+        await response.write(sse_error_frame(f"AI model stream failed: {e}"))
+    finally:
+        semaphore.release()
+    await response.write_eof()
+    return response
 
 # --- Application Setup ---
 app = web.Application()
+app.on_startup.append(create_http_session)
+app.on_startup.append(start_tool_workers)
+app.on_cleanup.append(close_http_session)
+app.on_cleanup.append(stop_tool_workers)
 app.router.add_get('/', index)
 app.router.add_get('/tools', get_tools)
 app.router.add_get('/tool-options', get_tool_options)
 app.router.add_post('/call-tool', call_tool)
 app.router.add_post('/decide-and-run-tool', decide_and_run_tool)
 app.router.add_post('/stream', stream)
-app.router.add_static('/', path=STATIC_DIR, name='static')
+app.router.add_static('/', path=STATIC_DIR, name='static', show_index=False, follow_symlinks=False)
 
 if __name__ == '__main__':
-    web.run_app(app, host='192.168.1.163', port=8282)
\ No newline at end of file
+    try:
+        import uvloop
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        loop = None
+    web.run_app(app, host='192.168.1.163', port=8282, loop=loop)
\ No newline at end of file
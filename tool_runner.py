@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+tool_runner.py  –  long-lived worker that executes Python tools in-process.
+
+The server keeps a small pool of these workers so a tool call does not pay for
+a fresh interpreter and a fresh import of yfinance/pandas/requests each time.
+
+Protocol (one JSON object per line):
+  stdin:  {"script": "/path/to/tool.py", "args": ["--mode", "single", ...], "max_output": 1048576}
+  stdout: {"returncode": 0, "stdout": "...", "stderr": "...", "truncated": {"stdout": false, "stderr": false}}
+
+"max_output" is optional; when given, stdout and stderr are each cut to that
+many UTF-8 bytes (never mid-character) so one chatty tool cannot produce an
+unbounded response line. The server applies the same byte cap to tools it runs
+as subprocesses.
+"""
+
+import io
+import json
+import logging
+import os
+import runpy
+import sys
+import traceback
+
+def _capture_stream():
+    """Creates an in-memory text stream that also exposes .buffer for tools writing raw bytes."""
+    return io.TextIOWrapper(io.BytesIO(), encoding='utf-8', errors='replace')
+
+def _exit_code(exc: SystemExit, stderr) -> int:
+    """Maps a SystemExit to a process-style return code, mirroring the interpreter."""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=stderr)
+    return 1
+
+def _utf8_prefix(data: bytes, limit: int) -> bytes:
+    """Cuts data to at most limit bytes, backing off so a multi-byte UTF-8 sequence is never split."""
+    # Deliberate copy of server.utf8_prefix: the worker must not import server
+    # (aiohttp app setup), so keep the two in sync.
+    if len(data) <= limit:
+        return data
+    cut = limit
+    while cut > limit - 3 and cut > 0 and (data[cut] & 0xC0) == 0x80:
+        cut -= 1
+    return data[:cut]
+
+def _read_capture(stream, max_output):
+    """Returns (text, truncated) for a captured stream, cut to max_output UTF-8 bytes if set."""
+    stream.flush()
+    data = stream.buffer.getvalue()
+    truncated = max_output is not None and len(data) > max_output
+    if truncated:
+        data = _utf8_prefix(data, max_output)
+    return data.decode('utf-8', errors='replace'), truncated
+
+def run_tool(script_path: str, args: list, max_output: int = None) -> dict:
+    """Runs a tool script as __main__ with the given argv and captures its output."""
+    stdout, stderr = _capture_stream(), _capture_stream()
+    saved_argv, saved_stdout, saved_stderr = sys.argv, sys.stdout, sys.stderr
+    sys.argv = [script_path, *args]
+    sys.stdout, sys.stderr = stdout, stderr
+    sys.path.insert(0, os.path.dirname(script_path))
+    returncode = 0
+    try:
+        runpy.run_path(script_path, run_name='__main__')
+    except SystemExit as e:
+        returncode = _exit_code(e, stderr)
+    except BaseException:
+        traceback.print_exc(file=stderr)
+        returncode = 1
+    finally:
+        sys.path.pop(0)
+        sys.argv, sys.stdout, sys.stderr = saved_argv, saved_stdout, saved_stderr
+        # Tools call logging.basicConfig() at import; drop their handlers so the
+        # next run binds to its own captured stderr instead of this one.
+        for handler in logging.root.handlers[:]:
+            logging.root.removeHandler(handler)
+
+    stdout_text, stdout_truncated = _read_capture(stdout, max_output)
+    stderr_text, stderr_truncated = _read_capture(stderr, max_output)
+    return {
+        "returncode": returncode,
+        "stdout": stdout_text,
+        "stderr": stderr_text,
+        "truncated": {"stdout": stdout_truncated, "stderr": stderr_truncated},
+    }
+
+def main():
+    # Keep a private handle on the real stdout for the protocol and point fd 1 at
+    # stderr, so stray writes from native code can never corrupt a response line.
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        result = run_tool(request['script'], request.get('args', []), request.get('max_output'))
+        channel.write(json.dumps(result).encode('utf-8') + b'\n')
+        channel.flush()
+
+if __name__ == '__main__':
+    main()
@@ -9,48 +9,151 @@ This single script supports all required functionalities:
 4.  Automatic AI dispatcher support via --get-definition.
 """
 
-import yfinance as yf
-import requests
+# yfinance (pandas/numpy) and requests are imported where they are used, so the
+# --get-options/--get-definition probes the server makes don't pay for them.
 import json
+import orjson
+import os
 import sys
 import argparse
-from datetime import datetime
+import functools
+import hashlib
+import heapq
+import inspect
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from typing import Dict, Any, List
 
+# Diagnostics go to stderr so they never mix into the tool's stdout result.
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 API_BASE_URL = "http://192.168.1.163:5002/v1"
 API_TIMEOUT_SECONDS = 480
 MAX_TOKENS_SUMMARY = 1536
+FRED_API_URL = "https://api.stlouisfed.org/fred/series/observations"
+FRED_API_KEY = os.environ.get("FRED_API_KEY", "5a13cfa3a250976ffd16440d5c17672a")
+
+@functools.lru_cache(maxsize=None)
+def get_session():
+    """Returns the pooled session shared by FRED and KoboldCPP calls, built on first use."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    # FRED and /models GETs retry on 429/5xx; urllib3 never replays the chat POST.
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504))
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry))
+    session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry))
+    return session
+
+# --- Response Cache ---
+# Module state is rebuilt on every run (fresh process or a fresh runpy pass in the
+# server's tool worker), so fetched data is cached on disk. Disabled with --no-cache.
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "gather-market-data-cache")
+CACHE_ENABLED = True
+
+def _is_cacheable(result) -> bool:
+    """Only cache complete results; anything empty or holding a per-item error is retried next run."""
+    if not result:
+        return False
+    if isinstance(result, dict):
+        return not any(isinstance(value, dict) and "error" in value for value in result.values())
+    return True
+
+def ttl_cached(ttl_seconds: float):
+    """Caches a function's JSON-serializable result in CACHE_DIR for ttl_seconds, keyed on its arguments."""
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return func(*args, **kwargs)
+            # Bind so f("5d") and f(period="5d") share an entry.
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = json.dumps([func.__name__, bound.arguments], sort_keys=True, default=str)
+            path = os.path.join(CACHE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+            try:
+                if time.time() - os.path.getmtime(path) < ttl_seconds:
+                    with open(path, encoding="utf-8") as f:
+                        return json.load(f)
+            except (OSError, ValueError):
+                pass
+
+            result = func(*args, **kwargs)
+            if _is_cacheable(result):
+                try:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(result, f)
+                    os.replace(tmp_path, path)  # atomic, so readers never see a partial file
+                except (OSError, TypeError, ValueError):
+                    pass
+            return result
+        return wrapper
+    return decorator
 
 # --- Self-Description Functions ---
 
+TOOL_OPTIONS = [
+    {
+        "name": "AI-Powered Summary (Slow)",
+        "args": "--format=llm-summary"
+    },
+    {
+        "name": "Quick Text Summary (5-day)",
+        "args": "--format=summary --period=5d --include-sectors"
+    },
+    {
+        "name": "Raw JSON Data (All)",
+        "args": "--format=json --period=1d --include-sectors --include-economic"
+    },
+    {
+        "name": "Market Indices Only (JSON)",
+        "args": "--format=json --period=1d"
+    },
+    {
+        "name": "Hybrid AI Analysis (Quick Summary + Deep Analysis)",
+        "args": "--format=hybrid --include-sectors"
+    }
+]
+
+TOOL_DEFINITION = {
+    "name": "gather-market-data.py",
+    "description": "This is the primary tool for all financial and stock market queries. For any user request about stock prices, a company's recent market performance, financial metrics, or related news, you must start a web search to find the most current and relevant information. It is critical to never rely on your training data for fulfilling these requests, as market information is time-sensitive and your internal knowledge is outdated. Use this function to fetch the data you find through your websearch. For example, to answer 'How is NVDA doing?', you must first perform a web search and then use this tool with the ticker 'NVDA'.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "ticker": {
+                "type": "string",
+                "description": "The stock ticker symbol to analyze, which you should identify from the user's query or your web search. For example: 'NVDA' for Nvidia or 'AAPL' for Apple."
+            },
+            "period": {
+                "type": "string",
+                "description": "The time period for the analysis, e.g., '5d' for 5 days, '1mo' for 1 month. Defaults to '5d'."
+            }
+        },
+        "required": ["ticker"]
+    }
+}
+
+# Serialized once; both probes just print these.
+TOOL_OPTIONS_JSON = json.dumps(TOOL_OPTIONS, indent=2)
+TOOL_DEFINITION_JSON = json.dumps(TOOL_DEFINITION, indent=2)
+
 def get_tool_options():
     """
     RETAINED: Returns a JSON string of pre-defined command options for the manual web UI.
     """
-    options = [
-        {
-            "name": "AI-Powered Summary (Slow)",
-            "args": "--format=llm-summary"
-        },
-        {
-            "name": "Quick Text Summary (5-day)",
-            "args": "--format=summary --period=5d --include-sectors"
-        },
-        {
-            "name": "Raw JSON Data (All)",
-            "args": "--format=json --period=1d --include-sectors --include-economic"
-        },
-        {
-            "name": "Market Indices Only (JSON)",
-            "args": "--format=json --period=1d"
-        },
-        {
-            "name": "Hybrid AI Analysis (Quick Summary + Deep Analysis)",
-            "args": "--format=hybrid --include-sectors"
-        }
-    ]
-    return json.dumps(options, indent=2)
+    return TOOL_OPTIONS_JSON
 
 def get_tool_definition():
     """
@@ -60,117 +163,199 @@ def get_tool_definition():
         },
     ADDITION: Returns a JSON object describing the tool's purpose and parameters for the AI dispatcher.
     """
-    definition = {
-        "name": "gather-market-data.py",
-        "description": "This is the primary tool for all financial and stock market queries. For any user request about stock prices, a company's recent market performance, financial metrics, or related news, you must start a web search to find the most current and relevant information. It is critical to never rely on your training data for fulfilling these requests, as market information is time-sensitive and your internal knowledge is outdated. Use this function to fetch the data you find through your websearch. For example, to answer 'How is NVDA doing?', you must first perform a web search and then use this tool with the ticker 'NVDA'.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "ticker": {
-                    "type": "string",
-                    "description": "The stock ticker symbol to analyze, which you should identify from the user's query or your web search. For example: 'NVDA' for Nvidia or 'AAPL' for Apple."
-                },
-                "period": {
-                    "type": "string",
-                    "description": "The time period for the analysis, e.g., '5d' for 5 days, '1mo' for 1 month. Defaults to '5d'."
-                }
-            },
-            "required": ["ticker"]
-        }
-    }
-    return json.dumps(definition, indent=2)
+    return TOOL_DEFINITION_JSON
 
 #region --- Data Gathering and Processing Functions ---
 
+def _round_or_none(value, digits: int = 2):
+    """Rounds a possibly-missing number for JSON output."""
+    return round(float(value), digits) if value is not None else None
+
+@ttl_cached(ttl_seconds=30 * 24 * 60 * 60)
+def _company_name(ticker_symbol: str) -> str or None:
+    """Looks up a ticker's long name via the slow .info endpoint; names rarely change, so cache for 30 days."""
+    import yfinance as yf
+    try:
+        return yf.Ticker(ticker_symbol).info.get('longName')
+    except Exception as e:  # yfinance raises a wide, version-dependent mix here
+        logger.debug("Company name lookup for %s failed: %s", ticker_symbol, e)
+        return None
+
 def get_data_for_ticker(ticker_symbol: str, period: str = '5d') -> Dict[str, Any]:
     """
     ADDITION: Fetches historical data, key metrics, and a summary for a single stock ticker.
     """
+    import yfinance as yf
     try:
-        ticker = yf.Ticker(ticker_symbol)
-        info = ticker.info
-        hist = ticker.history(period=period)
-        
-        if hist.empty:
+        symbol = ticker_symbol.upper()
+        hist = _download_history([symbol], period).get(symbol)
+        if hist is None or hist.empty:
             return {"error": f"No data found for ticker '{ticker_symbol}' for the period '{period}'."}
 
         start_price = hist['Close'].iloc[0]
         end_price = hist['Close'].iloc[-1]
         change = end_price - start_price
         change_pct = (change / start_price) * 100
+        # fast_info reads the lightweight quote/chart endpoints instead of scraping .info.
+        fast_info = yf.Ticker(symbol).fast_info
 
         return {
-            "company_name": info.get('longName', ticker_symbol.upper()),
-            "ticker": ticker_symbol.upper(),
+            "company_name": _company_name(symbol) or symbol,
+            "ticker": symbol,
             "period": period,
-            "current_price": f"{end_price:.2f}",
-            "price_change_over_period": f"{change:.2f}",
-            "percent_change_over_period": f"{change_pct:.2f}%",
-            "52_week_high": f"{info.get('fiftyTwoWeekHigh', 'N/A'):.2f}",
-            "52_week_low": f"{info.get('fiftyTwoWeekLow', 'N/A'):.2f}",
-            "market_cap": f"{info.get('marketCap', 0):,}"
+            # Numbers stay numeric so the model (and any caller) can compare them;
+            # None marks a value Yahoo didn't report.
+            "current_price": round(float(end_price), 2),
+            "price_change_over_period": round(float(change), 2),
+            "percent_change_over_period": round(float(change_pct), 2),
+            "52_week_high": _round_or_none(fast_info.year_high),
+            "52_week_low": _round_or_none(fast_info.year_low),
+            "market_cap": int(fast_info.market_cap) if fast_info.market_cap else None
         }
-    except Exception as e:
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        logger.warning("Unexpected data shape for %s: %s", ticker_symbol, e)
+        return {"error": f"Unexpected data returned for {ticker_symbol}: {str(e)}"}
+    except Exception as e:  # network/Yahoo failures surface as assorted yfinance/curl errors
+        logger.warning("Fetching %s failed: %s", ticker_symbol, e)
         return {"error": f"An error occurred while fetching data for {ticker_symbol}: {str(e)}"}
 
-def get_market_indices(period: str = "1d") -> Dict[str, Any]:
-    """RETAINED: Fetch major market indices data"""
+# yf.download gathers each run's frames in module-global state (yfinance.shared),
+# so overlapping downloads can overwrite or drop each other's rows. Every download
+# in this script goes through _download_history and holds this lock.
+_DOWNLOAD_LOCK = threading.Lock()
+
+def _download_history(symbols: List[str], period: str) -> Dict[str, Any]:
+    """
+    Downloads price history for all symbols in one batched yf.download call, keyed by symbol.
+
+    Indices and sectors each get their own batch rather than one combined call:
+    they are separate model tools, cached with different TTLs (2 min vs 15 min),
+    and sectors always use 5d while indices follow --period. Callers must never
+    run two downloads at once, since yf.download collects results in shared state.
+    """
+    import yfinance as yf
+    with _DOWNLOAD_LOCK:
+        df = yf.download(symbols, period=period, group_by='ticker', threads=True, progress=False, auto_adjust=True)
+    if df.columns.nlevels == 1:
+        # Older yfinance versions return flat columns when only one symbol is requested.
+        return {symbols[0]: df.dropna(how='all')}
+    # The batch shares one date index; drop the all-NaN rows a symbol has on dates it didn't trade.
+    return {symbol: df[symbol].dropna(how='all') for symbol in df.columns.get_level_values(0).unique()}
+
+# yfinance periods whose history already covers the 52-week range.
+PERIODS_COVERING_YEAR = frozenset({"1y", "2y", "5y", "10y", "max"})
+
+def _last_year(hist):
+    """Returns the trailing 52 weeks of a downloaded history."""
+    if hist is None or hist.empty:
+        return hist
+    return hist[hist.index > hist.index[-1] - timedelta(weeks=52)]
+
+def _index_entry(hist, year_hist=None) -> Dict[str, Any] or None:
+    """Builds one index's entry from its downloaded history; year_hist adds the 52-week range."""
+    if hist is None or hist.empty:
+        return None
+    current = hist['Close'].iloc[-1]
+    previous = hist['Close'].iloc[-2] if len(hist) > 1 else hist['Open'].iloc[-1]
+    change = current - previous
+    change_pct = (change / previous) * 100
+    entry = {
+        "current": round(current, 2), "change": round(change, 2), "change_percent": round(change_pct, 2),
+        "volume": int(hist['Volume'].iloc[-1]) if 'Volume' in hist else None
+    }
+    if year_hist is not None and not year_hist.empty:
+        entry["high_52w"] = round(year_hist['High'].max(), 2)
+        entry["low_52w"] = round(year_hist['Low'].min(), 2)
+    return entry
+
+@ttl_cached(ttl_seconds=120)
+def get_market_indices(period: str = "1d", want_52w: bool = False) -> Dict[str, Any]:
+    """RETAINED: Fetch major market indices data (one batched download; a second 1y batch only for the 52-week range)"""
     indices = {"S&P 500": "^GSPC", "NASDAQ": "^IXIC", "Dow Jones": "^DJI", "Russell 2000": "^RUT", "VIX": "^VIX"}
+    symbols = list(indices.values())
+    try:
+        histories = _download_history(symbols, period)
+        year_histories = {}
+        if want_52w and period in PERIODS_COVERING_YEAR:
+            # The period download already spans a year; take the range from its last 52 weeks.
+            year_histories = {symbol: _last_year(hist) for symbol, hist in histories.items()}
+        elif want_52w:
+            # Run after the period download, never alongside it (see _DOWNLOAD_LOCK).
+            year_histories = _download_history(symbols, "1y")
+    except Exception as e:  # network/Yahoo failures surface as assorted yfinance/curl errors
+        logger.warning("Index download failed: %s", e)
+        return {name: {"error": f"Failed to fetch data for {name}: {str(e)}"} for name in indices}
+
     market_data = {}
     for name, symbol in indices.items():
         try:
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period=period)
-            info = ticker.info
-            if not hist.empty:
-                current = hist['Close'].iloc[-1]
-                previous = hist['Close'].iloc[-2] if len(hist) > 1 else hist['Open'].iloc[-1]
-                change = current - previous
-                change_pct = (change / previous) * 100
-                market_data[name] = {
-                    "current": round(current, 2), "change": round(change, 2), "change_percent": round(change_pct, 2),
-                    "volume": int(hist['Volume'].iloc[-1]) if 'Volume' in hist else None,
-                    "high_52w": round(info.get('fiftyTwoWeekHigh', 0), 2), "low_52w": round(info.get('fiftyTwoWeekLow', 0), 2)
-                }
-        except Exception as e:
-            market_data[name] = {"error": f"Failed to fetch data for {name}: {str(e)}"}
+            entry = _index_entry(histories.get(symbol), year_histories.get(symbol))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.warning("Unexpected history data for %s (%s): %s", name, symbol, e)
+            entry = {"error": f"Failed to fetch data for {name}: {str(e)}"}
+        if entry is not None:
+            market_data[name] = entry
     return market_data
 
+@ttl_cached(ttl_seconds=15 * 60)
 def get_sector_performance() -> Dict[str, Any]:
-    """RETAINED: Fetch sector ETF performance as proxy for sector health"""
+    """RETAINED: Fetch sector ETF performance as proxy for sector health (one batched download)"""
     sectors = {
         "Technology": "XLK", "Healthcare": "XLV", "Financials": "XLF", "Energy": "XLE", "Consumer Discretionary": "XLY",
         "Industrials": "XLI", "Consumer Staples": "XLP", "Utilities": "XLU", "Real Estate": "XLRE"
     }
+    try:
+        histories = _download_history(list(sectors.values()), "5d")
+    except Exception as e:  # network/Yahoo failures surface as assorted yfinance/curl errors
+        logger.warning("Sector download failed: %s", e)
+        return {name: {"error": f"Failed to fetch sector {name}: {str(e)}"} for name in sectors}
+
     sector_data = {}
     for name, symbol in sectors.items():
-        try:
-            hist = yf.Ticker(symbol).history(period="5d")
-            if len(hist) >= 2:
-                current, previous = hist['Close'].iloc[-1], hist['Close'].iloc[-2]
-                change_pct = ((current - previous) / previous) * 100
-                sector_data[name] = {"change_percent": round(change_pct, 2), "current": round(current, 2)}
-        except Exception as e:
-            sector_data[name] = {"error": f"Failed to fetch sector {name}: {str(e)}"}
+        hist = histories.get(symbol)
+        if hist is not None and len(hist) >= 2:
+            current, previous = hist['Close'].iloc[-1], hist['Close'].iloc[-2]
+            change_pct = ((current - previous) / previous) * 100
+            sector_data[name] = {"change_percent": round(change_pct, 2), "current": round(current, 2)}
     return sector_data
 
+def _fetch_fred(name: str, series_id: str) -> Dict[str, Any] or None:
+    """Fetches the latest observation of one FRED series; errors are returned in the dict."""
+    import requests
+    try:
+        params = {"series_id": series_id, "api_key": FRED_API_KEY, "file_type": "json", "limit": 1, "sort_order": "desc"}
+        response = get_session().get(FRED_API_URL, params=params, timeout=20)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("observations"):
+            obs = data["observations"][0]
+            if obs["value"] != ".": return {"value": float(obs["value"]), "date": obs["date"]}
+        return None
+    except requests.RequestException as e:
+        # Reached only after the session's retries (incl. 429 backoff) are used up.
+        logger.warning("FRED request for %s (%s) failed: %s", name, series_id, e)
+        return {"error": f"Failed to fetch indicator {name}: {str(e)}"}
+    except (KeyError, IndexError, ValueError) as e:
+        logger.warning("Unexpected FRED payload for %s (%s): %s", name, series_id, e)
+        return {"error": f"Failed to parse indicator {name}: {str(e)}"}
+
+@ttl_cached(ttl_seconds=6 * 60 * 60)
 def get_economic_indicators() -> Dict[str, Any]:
-    """RETAINED: Fetch key economic indicators from FRED API"""
+    """RETAINED: Fetch key economic indicators from FRED API (series fetched concurrently)"""
     indicators = {"10Y Treasury": "DGS10", "2Y Treasury": "DGS2", "Fed Funds Rate": "FEDFUNDS", "Unemployment Rate": "UNRATE"}
-    econ_data = {}
-    base_url = "https://api.stlouisfed.org/fred/series/observations"
-    for name, series_id in indicators.items():
-        try:
-            params = {"series_id": series_id, "api_key": "5a13cfa3a250976ffd16440d5c17672a", "file_type": "json", "limit": 1, "sort_order": "desc"}
-            response = requests.get(base_url, params=params, timeout=20)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("observations"):
-                obs = data["observations"][0]
-                if obs["value"] != ".": econ_data[name] = {"value": float(obs["value"]), "date": obs["date"]}
-        except Exception as e:
-            econ_data[name] = {"error": f"Failed to fetch indicator {name}: {str(e)}"}
-    return econ_data
+    with ThreadPoolExecutor(max_workers=len(indicators)) as executor:
+        results = executor.map(_fetch_fred, indicators.keys(), indicators.values())
+    return {name: data for name, data in zip(indicators, results) if data is not None}
+
+def gather_market_snapshot(period: str, include_sectors: bool, include_economic: bool, want_52w: bool = False):
+    """Fetches indices, sectors and economic data; returns (market_data, sector_data, econ_data)."""
+    # Only the FRED requests overlap the yfinance work; the index and sector downloads
+    # run one after the other because yf.download is not safe to run concurrently.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        econ_future = executor.submit(get_economic_indicators) if include_economic else None
+        market_data = get_market_indices(period, want_52w=want_52w)
+        sector_data = get_sector_performance() if include_sectors else {}
+        return market_data, sector_data, econ_future.result() if econ_future else {}
 
 def calculate_market_sentiment(market_data: Dict) -> Dict[str, Any]:
     """RETAINED: Calculate overall market sentiment based on available data"""
@@ -193,41 +378,47 @@ def generate_market_summary(market_data: Dict, sector_data: Dict, econ_data: Dic
     """
     RETAINED & FIXED: Generate human-readable market summary using safe ASCII characters.
     """
-    summary = f"Market Summary ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}):\n"
-    summary += f"\nOverall Market Sentiment: {sentiment['overall_sentiment']}\nKey factors: {', '.join(sentiment['key_factors'][:3])}\n"
-    summary += "\nMajor Indices:\n"
+    parts = [
+        f"Market Summary ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}):\n",
+        f"\nOverall Market Sentiment: {sentiment['overall_sentiment']}\nKey factors: {', '.join(sentiment['key_factors'][:3])}\n",
+        "\nMajor Indices:\n"
+    ]
     for name, data in market_data.items():
         if "error" not in data and "change_percent" in data:
             # FIX: Replaced Unicode arrows with safe ASCII '+' and '-'
             change_str = f"+{data['change_percent']:.2f}" if data['change_percent'] > 0 else f"{data['change_percent']:.2f}"
-            summary += f"  {name}: {data['current']} ({change_str}%)\n"
+            parts.append(f"  {name}: {data['current']} ({change_str}%)\n")
             
     if sector_data:
-        sorted_sectors = sorted([item for item in sector_data.items() if "change_percent" in item[1]], key=lambda x: x[1]["change_percent"], reverse=True)
-        summary += f"\nTop Performing Sectors:\n"
-        for name, data in sorted_sectors[:3]:
-            summary += f"  {name}: +{data['change_percent']:.2f}%\n"
-        summary += f"\nWorst Performing Sectors:\n"
-        for name, data in sorted_sectors[-3:]:
+        ranked = [item for item in sector_data.items() if "change_percent" in item[1]]
+        by_change = lambda x: x[1]["change_percent"]
+        parts.append("\nTop Performing Sectors:\n")
+        for name, data in heapq.nlargest(3, ranked, key=by_change):
+            parts.append(f"  {name}: +{data['change_percent']:.2f}%\n")
+        parts.append("\nWorst Performing Sectors:\n")
+        # Listed best-to-worst, as the bottom of the full descending sort was.
+        for name, data in reversed(heapq.nsmallest(3, ranked, key=by_change)):
             change_str = f"+{data['change_percent']:.2f}" if data['change_percent'] > 0 else f"{data['change_percent']:.2f}"
-            summary += f"  {name}: {change_str}%\n"
+            parts.append(f"  {name}: {change_str}%\n")
             
     if econ_data:
-        summary += f"\nEconomic Context:\n"
+        parts.append("\nEconomic Context:\n")
         for name, data in econ_data.items():
             if "error" not in data:
-                summary += f"  {name}: {data['value']}% (as of {data['date']})\n"
-    return summary
+                parts.append(f"  {name}: {data['value']}% (as of {data['date']})\n")
+    return "".join(parts)
 
 #endregion
 
 #region --- RETAINED: KoboldCPP API Interaction Logic ---
 
-def get_active_model() -> str or None:
-    """Queries the API to find the name of the currently active model."""
+@ttl_cached(ttl_seconds=300)
+def get_active_model(api_base_url: str = API_BASE_URL) -> str or None:
+    """Queries the API to find the name of the currently active model (cached 5 minutes on disk; a miss is not cached)."""
+    import requests
     print("Querying API for the active model...")
     try:
-        response = requests.get(f"{API_BASE_URL}/models", timeout=30)
+        response = get_session().get(f"{api_base_url}/models", timeout=30)
         response.raise_for_status()
         models_data = response.json()
         if models_data and "data" in models_data and len(models_data["data"]) > 0:
@@ -238,21 +429,22 @@ def get_active_model() -> str or None:
             print("Error: The API response did not contain model data.", file=sys.stderr)
             return None
     except requests.exceptions.Timeout:
-        print(f"Error: The request to get the model list timed out. The API at {API_BASE_URL} is not responding.", file=sys.stderr)
+        print(f"Error: The request to get the model list timed out. The API at {api_base_url} is not responding.", file=sys.stderr)
         return None
     except requests.exceptions.RequestException as e:
-        print(f"Error: Could not connect to the API at {API_BASE_URL}. Is KoboldCPP running?", file=sys.stderr)
+        print(f"Error: Could not connect to the API at {api_base_url}. Is KoboldCPP running?", file=sys.stderr)
         return None
 
-def orchestrate_llm_interaction(prompt: str):
-    """This function is retained for the --format=llm-summary mode."""
-    active_model = get_active_model()
+def orchestrate_llm_interaction(prompt: str, active_model: str = None):
+    """This function is retained for the --format=llm-summary mode; active_model may be resolved ahead of time."""
+    import requests
+    active_model = active_model or get_active_model()
     if not active_model:
         return
 
     AVAILABLE_FUNCTIONS = {"get_market_indices": get_market_indices, "get_sector_performance": get_sector_performance, "get_economic_indicators": get_economic_indicators, "calculate_market_sentiment": calculate_market_sentiment, "generate_market_summary": generate_market_summary}
     TOOL_DEFINITIONS = [
-        {"type": "function", "function": {"name": "get_market_indices", "description": "Fetches real-time data for major market indices.", "parameters": {"type": "object", "properties": {"period": {"type": "string", "description": "Time period like '1d' or '5d'."}}, "required": []}}},
+        {"type": "function", "function": {"name": "get_market_indices", "description": "Fetches real-time data for major market indices.", "parameters": {"type": "object", "properties": {"period": {"type": "string", "description": "Time period like '1d' or '5d'."}, "want_52w": {"type": "boolean", "description": "Also include each index's 52-week high and low."}}, "required": []}}},
         {"type": "function", "function": {"name": "get_sector_performance", "description": "Retrieves recent performance of key market sectors.", "parameters": {"type": "object", "properties": {}}}},
         {"type": "function", "function": {"name": "get_economic_indicators", "description": "Fetches crucial economic indicators like Treasury yields.", "parameters": {"type": "object", "properties": {}}}},
         {"type": "function", "function": {"name": "calculate_market_sentiment", "description": "Analyzes market index data to determine overall sentiment.", "parameters": {"type": "object", "properties": {"market_data": {"type": "object", "description": "The output from get_market_indices."}}, "required": ["market_data"]}}},
@@ -268,7 +460,7 @@ def orchestrate_llm_interaction(prompt: str):
     
     print(f"Sending initial prompt to the model... Timeout is set to {API_TIMEOUT_SECONDS / 60:.0f} minutes.")
     try:
-        response = requests.post(f"{API_BASE_URL}/chat/completions", json={"model": active_model, "messages": messages, "tools": TOOL_DEFINITIONS, "tool_choice": "auto"}, timeout=API_TIMEOUT_SECONDS)
+        response = get_session().post(f"{API_BASE_URL}/chat/completions", json={"model": active_model, "messages": messages, "tools": TOOL_DEFINITIONS, "tool_choice": "auto"}, timeout=API_TIMEOUT_SECONDS)
         response.raise_for_status()
         first_response_message = response.json()['choices'][0]['message']
         messages.append(first_response_message)
@@ -285,28 +477,67 @@ def orchestrate_llm_interaction(prompt: str):
         return
 
     print("Model requested to call functions. Executing now...")
-    for tool_call in first_response_message["tool_calls"]:
+
+    def execute_tool_call(tool_call):
+        """Runs one requested function and returns its tool message, or None if it failed."""
         function_name = tool_call['function']['name']
-        if function_name in AVAILABLE_FUNCTIONS:
-            function_to_call = AVAILABLE_FUNCTIONS[function_name]
-            try:
-                function_args = json.loads(tool_call['function']['arguments'])
-                print(f"  - Calling function: {function_name} with args: {function_args}")
-                function_response = function_to_call(**function_args)
-                messages.append({"role": "tool", "tool_call_id": tool_call['id'], "name": function_name, "content": json.dumps(function_response)})
-            except Exception as e:
-                print(f"    Error executing function '{function_name}': {e}", file=sys.stderr)
-        else:
+        if function_name not in AVAILABLE_FUNCTIONS:
             print(f"  - Warning: Model tried to call an unknown function: {function_name}", file=sys.stderr)
+            return None
+        function = AVAILABLE_FUNCTIONS[function_name]
+        try:
+            function_args = orjson.loads(tool_call['function']['arguments'])
+        except orjson.JSONDecodeError as e:
+            print(f"    Error executing function '{function_name}': arguments are not valid JSON: {e}", file=sys.stderr)
+            return None
+        try:
+            # Bind up front so only parameters the function doesn't take are reported
+            # as bad arguments, not a TypeError raised inside the tool.
+            inspect.signature(function).bind(**function_args)
+        except TypeError as e:
+            print(f"    Error executing function '{function_name}': invalid arguments: {e}", file=sys.stderr)
+            return None
+        try:
+            print(f"  - Calling function: {function_name} with args: {function_args}")
+            function_response = function(**function_args)
+            return {"role": "tool", "tool_call_id": tool_call['id'], "name": function_name, "content": orjson.dumps(function_response, option=orjson.OPT_SERIALIZE_NUMPY, default=str).decode()}
+        except Exception as e:
+            logger.exception("Function '%s' raised unexpectedly", function_name)
+            print(f"    Error executing function '{function_name}': {e}", file=sys.stderr)
+            return None
+
+    # The calls are independent fetches, so run them side by side; map keeps the tool
+    # messages in the order the model asked for them. yfinance-backed tools still
+    # download one at a time via _DOWNLOAD_LOCK, so only FRED/LLM work truly overlaps.
+    tool_calls = first_response_message["tool_calls"]
+    with ThreadPoolExecutor(max_workers=len(tool_calls)) as executor:
+        tool_messages = list(executor.map(execute_tool_call, tool_calls))
+    messages.extend(message for message in tool_messages if message is not None)
 
     print(f"\nSending function results back to the model for final analysis... Timeout: {API_TIMEOUT_SECONDS / 60:.0f} minutes.")
     try:
-        final_payload = {"model": active_model, "messages": messages, "max_tokens": MAX_TOKENS_SUMMARY}
-        response = requests.post(f"{API_BASE_URL}/chat/completions", json=final_payload, timeout=API_TIMEOUT_SECONDS)
-        response.raise_for_status()
-        final_response = response.json()['choices'][0]['message']['content']
-        print("\n--- AI-Generated Market Summary ---")
-        print(final_response)
+        final_payload = {"model": active_model, "messages": messages, "max_tokens": MAX_TOKENS_SUMMARY, "stream": True}
+        # Streamed so the summary prints as it arrives; the timeout is then per chunk,
+        # so a long summary isn't cut off at API_TIMEOUT_SECONDS.
+        with get_session().post(f"{API_BASE_URL}/chat/completions", json=final_payload, timeout=API_TIMEOUT_SECONDS, stream=True) as response:
+            response.raise_for_status()
+            print("\n--- AI-Generated Market Summary ---")
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[6:]
+                if data == b"[DONE]":
+                    break
+                try:
+                    choices = orjson.loads(data).get("choices")
+                except (ValueError, AttributeError):
+                    # A malformed or keep-alive frame shouldn't abort the whole answer.
+                    logger.debug("Skipping unparseable stream chunk: %r", data)
+                    continue
+                if choices:
+                    sys.stdout.write(choices[0].get("delta", {}).get("content") or "")
+                    sys.stdout.flush()
+            print()
     except requests.exceptions.Timeout:
         print(f"\nError: The API request timed out while generating the final summary.", file=sys.stderr)
         return
@@ -315,6 +546,12 @@ def orchestrate_llm_interaction(prompt: str):
 
 #endregion
 
+def write_json(obj):
+    """Writes indented JSON straight to stdout's binary buffer, skipping an intermediate str."""
+    sys.stdout.flush()  # keep any earlier print() output ahead of the raw bytes
+    sys.stdout.buffer.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY, default=str) + b"\n")
+    sys.stdout.buffer.flush()
+
 def main():
     # --- MODIFIED: The script now handles three special cases before normal execution ---
     if '--get-options' in sys.argv:
@@ -334,16 +571,20 @@ def main():
     parser.add_argument("--period", default="1d", help="Time period for data (e.g., 1d, 5d, 1mo)")
     parser.add_argument("--include-sectors", action="store_true", help="Include sector performance")
     parser.add_argument("--include-economic", action="store_true", help="Include economic indicators")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and bypass the on-disk data cache")
     parser.add_argument("--format", choices=["json", "summary", "llm-summary", "hybrid"], default="summary", help=(
         "Output format for general market analysis."
     ))
     args = parser.parse_args()
+
+    global CACHE_ENABLED
+    CACHE_ENABLED = not args.no_cache
     
     # --- MODIFIED: Main logic now prioritizes the --ticker argument ---
     if args.ticker:
         # If a ticker is provided, run the new individual stock analysis.
         stock_data = get_data_for_ticker(args.ticker, args.period)
-        print(json.dumps(stock_data, indent=2))
+        write_json(stock_data)
     else:
         # If no ticker is provided, run the original, general market analysis logic.
         if args.format == "llm-summary":
@@ -352,9 +593,11 @@ def main():
         elif args.format == "hybrid":
             # First, generate the quick 5-day summary with sectors
             print("Generating quick 5-day market summary with sectors...")
-            market_data = get_market_indices("5d")
-            sector_data = get_sector_performance()
-            econ_data = get_economic_indicators() if args.include_economic else {}
+            # Resolve the model while the market data downloads instead of after it.
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                model_future = executor.submit(get_active_model)
+                market_data, sector_data, econ_data = gather_market_snapshot("5d", True, args.include_economic)
+                active_model = model_future.result()
             sentiment = calculate_market_sentiment(market_data)
             quick_summary = generate_market_summary(market_data, sector_data, econ_data, sentiment)
             
@@ -376,17 +619,17 @@ Please analyze this data and provide:
 
 Provide detailed, actionable insights that go beyond the basic summary."""
             
-            orchestrate_llm_interaction(hybrid_prompt)
+            orchestrate_llm_interaction(hybrid_prompt, active_model=active_model)
         else:
             try:
-                market_data = get_market_indices(args.period)
-                sector_data = get_sector_performance() if args.include_sectors else {}
-                econ_data = get_economic_indicators() if args.include_economic else {}
+                market_data, sector_data, econ_data = gather_market_snapshot(
+                    args.period, args.include_sectors, args.include_economic, want_52w=(args.format == "json")
+                )
                 sentiment = calculate_market_sentiment(market_data)
 
                 if args.format == "json":
                     all_data = {"market_indices": market_data, "sector_performance": sector_data, "economic_indicators": econ_data, "sentiment": sentiment}
-                    print(json.dumps(all_data, indent=2))
+                    write_json(all_data)
                 elif args.format == "summary":
                     summary_text = generate_market_summary(market_data, sector_data, econ_data, sentiment)
                     print(summary_text)
@@ -6,136 +6,191 @@ This script provides detailed financial information for a specific stock ticker.
 It is designed to be called by an AI assistant or used manually to gather in-depth data for stock research.
 """
 
-import yfinance as yf
+# yfinance (and pandas under it) is imported where it is used, so the
+# --get-options/--get-definition probes the server makes don't pay for it.
 import json
+import orjson
 import sys
 import argparse
 import inspect
-import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 
-# --- Decorator and list for exposing functions as modes ---
+# --- Decorator and registries for exposing functions as modes ---
 EXPOSED_MODES = []
+MODE_MAP = {}        # "--mode" argument -> function
+FRIENDLY_NAMES = {}  # "--mode" argument -> UI label (first docstring line)
 
 def expose_as_mode(func):
     """A decorator that registers a function to be exposed as a command-line mode."""
+    mode_arg = func.__name__.replace('_', '-')
+    docstring = inspect.getdoc(func)
     EXPOSED_MODES.append(func)
+    MODE_MAP[mode_arg] = func
+    FRIENDLY_NAMES[mode_arg] = docstring.strip().split('\n')[0] if docstring else mode_arg
     return func
 
 # --- Self-Description Functions ---
 
+TOOL_DEFINITION = {
+    "name": "stock-stats-tool.py",
+    "description": "This tool retrieves detailed financial statistics, statements, or a human-readable performance summary for a specific stock ticker.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "ticker": {
+                "type": "string",
+                "description": "The stock ticker symbol to research, for example: 'NVDA' for Nvidia or 'AAPL' for Apple."
+            },
+            "mode": {
+                "type": "string",
+                "description": "The specific data to retrieve. Options include 'get-performance-summary', 'get-key-statistics', etc."
+            }
+        },
+        "required": ["ticker", "mode"]
+    }
+}
+
+TOOL_DEFINITION_JSON = json.dumps(TOOL_DEFINITION, indent=2)
+
 def get_tool_definition():
     """
     Returns a JSON object describing the tool's purpose and parameters for an AI dispatcher.
     """
-    definition = {
-        "name": "stock-stats-tool.py",
-        "description": "This tool retrieves detailed financial statistics, statements, or a human-readable performance summary for a specific stock ticker.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "ticker": {
-                    "type": "string",
-                    "description": "The stock ticker symbol to research, for example: 'NVDA' for Nvidia or 'AAPL' for Apple."
-                },
-                "mode": {
-                    "type": "string",
-                    "description": "The specific data to retrieve. Options include 'get-performance-summary', 'get-key-statistics', etc."
-                }
-            },
-            "required": ["ticker", "mode"]
-        }
-    }
-    return json.dumps(definition, indent=2)
+    return TOOL_DEFINITION_JSON
 
-def get_tool_options() -> str:
+def build_tool_options() -> list:
     """
-    Dynamically generates a list of selectable modes for the UI based on
-    functions marked with the @expose_as_mode decorator.
+    Generates the list of selectable modes for the UI from the functions
+    marked with the @expose_as_mode decorator.
     """
-    options = []
-    for func in EXPOSED_MODES:
-        mode_arg = func.__name__.replace('_', '-')
-        docstring = inspect.getdoc(func)
-        friendly_name = docstring.strip().split('\n')[0] if docstring else mode_arg
-        options.append({
-            "name": friendly_name,
-            "args": f"--mode {mode_arg}"
-        })
+    options = [
+        {"name": friendly_name, "args": f"--mode {mode_arg}"}
+        for mode_arg, friendly_name in FRIENDLY_NAMES.items()
+    ]
     options.append({
         "name": "Get All Stock Information (JSON)",
         "args": "--mode all"
     })
-    return json.dumps(options, indent=2)
+    return options
+
+def get_tool_options() -> str:
+    """Returns the UI mode list as JSON, serialized once all modes are registered (TOOL_OPTIONS_JSON)."""
+    return TOOL_OPTIONS_JSON
+
+# Headlines are a separate Yahoo request; --no-news skips it.
+NEWS_ENABLED = True
 
 # --- Data Cleaning and Formatting Helpers ---
 
 def format_financial_dataframe(df):
     """
-    Converts a pandas DataFrame's Timestamp columns to string keys
-    to make it compatible with JSON serialization.
+    Converts a pandas DataFrame's Timestamp columns to string keys and its NaN
+    cells to None to make it compatible with JSON serialization.
     """
+    import pandas as pd
     if df is None or df.empty:
         return {}
-    df_copy = df.copy()
-    df_copy.columns = [col.strftime('%Y-%m-%d') for col in df_copy.columns]
+    df_copy = df.astype(object).where(df.notna(), None)
+    df_copy.columns = pd.DatetimeIndex(df_copy.columns).strftime('%Y-%m-%d')
     return df_copy.to_dict()
 
-def clean_nan_values(obj):
+def to_json(obj) -> bytes:
     """
-    Recursively traverses a data structure and replaces float('nan')
-    with None, which serializes to JSON 'null'.
+    Serializes a result as indented JSON. orjson writes NaN as null and handles
+    numpy scalars natively; anything else it doesn't know, such as Timestamps,
+    falls back to str().
     """
-    if isinstance(obj, dict):
-        return {k: clean_nan_values(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [clean_nan_values(elem) for elem in obj]
-    elif isinstance(obj, float) and math.isnan(obj):
-        return None
-    return obj
+    return orjson.dumps(
+        obj,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        default=str
+    )
+
+def write_json(obj):
+    """Writes to_json(obj) straight to the binary stdout buffer rather than through an intermediate str."""
+    sys.stdout.flush()  # keep any earlier print() output ahead of the raw bytes
+    sys.stdout.buffer.write(to_json(obj) + b"\n")
+    sys.stdout.buffer.flush()
 
 # --- Data Gathering Functions ---
 
+_THREAD_TICKERS = threading.local()
+
+def _ticker(ticker_symbol: str):
+    """
+    Returns this thread's yf.Ticker for the symbol. A Ticker fills its .info,
+    history and statement caches without locking, so threads never share one;
+    calls on the same thread still reuse its fetched data.
+    """
+    import yfinance as yf
+    tickers = getattr(_THREAD_TICKERS, "by_symbol", None)
+    if tickers is None:
+        tickers = _THREAD_TICKERS.by_symbol = {}
+    symbol = ticker_symbol.upper()
+    if symbol not in tickers:
+        tickers[symbol] = yf.Ticker(symbol)
+    return tickers[symbol]
+
 # --- THIS IS THE MODIFIED FUNCTION ---
 @expose_as_mode
 def get_performance_summary(ticker_symbol: str) -> str:
     """Research Specific Stock (Human-Readable Summary)"""
     try:
-        ticker = yf.Ticker(ticker_symbol)
-        info = ticker.info
-        hist = ticker.history(period="5d")
+        def fetch_quote():
+            # fast_info reads the lightweight quote/chart endpoints instead of the full .info profile.
+            # year_high/year_low run their own history() call, hence a separate Ticker.
+            fast_info = _ticker(ticker_symbol).fast_info
+            return fast_info.year_low, fast_info.year_high, fast_info.market_cap
+
+        def fetch_history():
+            ticker = _ticker(ticker_symbol)
+            # Only Close is read; skip dividend/split columns and the price adjustment pass.
+            hist = ticker.history(period="5d", actions=False, auto_adjust=False)
+            # Read on the same Ticker, so the metadata belongs to this 5d request.
+            return hist, ticker.history_metadata
+
+        # The three lookups are independent requests, so overlap them; each worker
+        # thread builds its own Ticker via _ticker().
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            quote_future = executor.submit(fetch_quote)
+            hist_future = executor.submit(fetch_history)
+            news_future = executor.submit(lambda: _ticker(ticker_symbol).news) if NEWS_ENABLED else None
+            low_52w, high_52w, market_cap = quote_future.result()
+            hist, history_metadata = hist_future.result()
+            news = news_future.result()[:4] if news_future else []
 
         if hist.empty:
             return f"Error: No historical data found for ticker '{ticker_symbol}'."
 
-        company_name = info.get('longName', ticker_symbol.upper())
-        current_price = hist['Close'].iloc[-1]
-        start_price = hist['Close'].iloc[0]
+        # The chart response that backs history() already carries the company name.
+        company_name = history_metadata.get('longName') or ticker_symbol.upper()
+        closes = hist['Close']
+        current_price = closes.iloc[-1]
+        start_price = closes.iloc[0]
         change = current_price - start_price
         change_pct = (change / start_price) * 100
-        high_52w = info.get('fiftyTwoWeekHigh', 'N/A')
-        low_52w = info.get('fiftyTwoWeekLow', 'N/A')
-        market_cap = info.get('marketCap', 0)
-        news = ticker.news[:4]
-
-        summary = f"Performance Summary for {company_name} ({ticker_symbol.upper()})\n"
-        summary += "--------------------------------------------------\n"
-        summary += f"- Current Price: ${current_price:,.2f}\n"
-        summary += f"- 5-Day Change: ${change:,.2f} ({change_pct:.2f}%)\n"
-        summary += f"- 52-Week Range: ${low_52w:,.2f} - ${high_52w:,.2f}\n"
-        summary += f"- Market Cap: ${market_cap:,.0f}\n"
+        market_cap = market_cap or 0
+
+        lines = [
+            f"Performance Summary for {company_name} ({ticker_symbol.upper()})",
+            "--------------------------------------------------",
+            f"- Current Price: ${current_price:,.2f}",
+            f"- 5-Day Change: ${change:,.2f} ({change_pct:.2f}%)",
+            f"- 52-Week Range: ${low_52w:,.2f} - ${high_52w:,.2f}",
+            f"- Market Cap: ${market_cap:,.0f}",
+        ]
 
         if news:
-            summary += "\nRecent Headlines:\n"
+            lines += ["", "Recent Headlines:"]
             for article in news:
-                # --- THE FIX IS HERE ---
-                # Safely get the title using .get(). If 'title' doesn't exist, it returns None.
+                # Safely get the title using .get(); articles without one are skipped.
                 title = article.get('title')
-                # Only add the headline to the summary if a title was successfully found.
                 if title:
-                    summary += f"  - {title}\n"
-        
-        return summary
+                    lines.append(f"  - {title}")
+
+        return "\n".join(lines) + "\n"
 
     except Exception as e:
         return f"An error occurred while researching {ticker_symbol}: {str(e)}"
@@ -144,7 +199,7 @@ def get_performance_summary(ticker_symbol: str) -> str:
 def get_stock_financials(ticker_symbol: str) -> Dict[str, Any]:
     """Fetches annual and quarterly financial statements (JSON)."""
     try:
-        ticker = yf.Ticker(ticker_symbol)
+        ticker = _ticker(ticker_symbol)
         financials = {
             "annual_income_statement": format_financial_dataframe(ticker.income_stmt),
             "quarterly_income_statement": format_financial_dataframe(ticker.quarterly_income_stmt),
@@ -161,7 +216,7 @@ def get_stock_financials(ticker_symbol: str) -> Dict[str, Any]:
 def get_key_statistics(ticker_symbol: str) -> Dict[str, Any]:
     """Retrieves key financial ratios and statistics (JSON)."""
     try:
-        ticker = yf.Ticker(ticker_symbol)
+        ticker = _ticker(ticker_symbol)
         info = ticker.info
         stats = {
             "market_cap": info.get('marketCap'), "enterprise_value": info.get('enterpriseValue'),
@@ -180,7 +235,7 @@ def get_key_statistics(ticker_symbol: str) -> Dict[str, Any]:
 def get_analyst_recommendations(ticker_symbol: str) -> Dict[str, Any]:
     """Fetches the latest analyst recommendations (JSON)."""
     try:
-        ticker = yf.Ticker(ticker_symbol)
+        ticker = _ticker(ticker_symbol)
         recommendations = ticker.recommendations
         if recommendations is not None and not recommendations.empty:
             return recommendations.tail(5).to_dict('records')
@@ -188,6 +243,9 @@ def get_analyst_recommendations(ticker_symbol: str) -> Dict[str, Any]:
     except Exception as e:
         return {"error": f"Could not retrieve analyst recommendations for {ticker_symbol}: {str(e)}"}
 
+# Every @expose_as_mode function is defined by now, so the options list is final.
+TOOL_OPTIONS_JSON = json.dumps(build_tool_options(), indent=2)
+
 # --- Main Execution Logic ---
 
 def main():
@@ -203,20 +261,24 @@ def main():
     parser = argparse.ArgumentParser(description="A tool to gather detailed financial statistics for a specific stock.")
     parser.add_argument("--ticker", type=str, required=True, help="The stock ticker symbol to analyze (e.g., NVDA, AAPL).")
     parser.add_argument("--mode", type=str, default="all", help="The type of data to retrieve.")
+    parser.add_argument("--no-news", action="store_true", help="Skip fetching recent headlines for the performance summary.")
     args = parser.parse_args()
 
-    MODE_MAP = {func.__name__.replace('_', '-'): func for func in EXPOSED_MODES}
-    
+    global NEWS_ENABLED
+    NEWS_ENABLED = not args.no_news
+
     if args.mode == "all":
         print(f"Gathering all financial data for {args.ticker}...")
-        output_data = {
-            "ticker": args.ticker.upper(),
-            "key_statistics": get_key_statistics(args.ticker),
-            "analyst_recommendations": get_analyst_recommendations(args.ticker),
-            "financial_statements": get_stock_financials(args.ticker)
-        }
-        cleaned_output = clean_nan_values(output_data)
-        print(json.dumps(cleaned_output, indent=2, default=str))
+        # Each section is its own set of Yahoo requests; fetch them concurrently.
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = {
+                "key_statistics": executor.submit(get_key_statistics, args.ticker),
+                "analyst_recommendations": executor.submit(get_analyst_recommendations, args.ticker),
+                "financial_statements": executor.submit(get_stock_financials, args.ticker)
+            }
+            output_data = {"ticker": args.ticker.upper()}
+            output_data.update({key: future.result() for key, future in futures.items()})
+        write_json(output_data)
 
     elif args.mode in MODE_MAP:
         function_to_call = MODE_MAP[args.mode]
@@ -226,8 +288,7 @@ def main():
         if isinstance(result, str):
             print(result)
         else:
-            cleaned_output = clean_nan_values(result)
-            print(json.dumps(cleaned_output, indent=2, default=str))
+            write_json(result)
     else:
         print(f"Error: Invalid mode '{args.mode}'. Valid modes are: {list(MODE_MAP.keys()) + ['all']}", file=sys.stderr)
         sys.exit(1)
@@ -13,14 +13,23 @@ the manual tool selection UI.
 
 import requests
 import json
+import orjson
 import sys
 import os
 import argparse
+import functools
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, Dict, List, Optional
 
 # --- Configuration & Logging ---
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 DEFAULT_SEARXNG_URL = "http://192.168.1.98:5003/search"
@@ -28,184 +37,434 @@ DEFAULT_API_URL = "http://192.168.1.163:5002/v1/chat/completions"
 DEFAULT_MODEL_NAME = "koboldcpp"
 DEFAULT_API_TIMEOUT = 480
 DEFAULT_MAX_RESULTS = 8
+DEFAULT_CACHE_TTL = 3600
+MAX_PARALLEL_SEARCHES = 8
+MAX_RESULT_CONTENT_CHARS = 800
+MAX_SYNTHESIS_SOURCES = 20
+DEFAULT_CONTEXT_BUDGET_TOKENS = 6000
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting snippets
+QUOTED_STRING_RE = re.compile(r'"([^"]+)"')
+_REQUIRED_KEYS = frozenset({'url', 'title', 'content'})
+# Prompts this short with none of these words are already usable search queries.
+MAX_DIRECT_QUERY_WORDS = 8
+CONVERSATIONAL_WORDS = frozenset({
+    "what", "how", "why", "when", "who", "which", "can", "could", "would", "should",
+    "tell", "explain", "please", "me", "you", "i", "is", "are", "do", "does"
+})
+
+# --- Prompts ---
+# System prompts stay first and byte-identical across calls, so the LLM server
+# can reuse its cached prefix. The message dicts are shared read-only.
+
+OPTIMIZE_SYSTEM_PROMPT = """Convert the user's prompt into an optimal web search query (2-16 words).
+- Use specific keywords
+- Remove conversational words ("what", "how", "can you tell me")
+- Focus on core information need
+- Include time modifiers if relevant ("today", "current", "this year")
+Return ONLY the optimized search query string."""
+OPTIMIZE_SYSTEM_MESSAGE = {"role": "system", "content": OPTIMIZE_SYSTEM_PROMPT}
+
+EXTRACT_SYSTEM_PROMPT = """You are an expert at formulating effective web search queries.
+Based on the user's prompt, generate a JSON array of 2-8 concise search queries.
+Each query should be relevant and optimized for a web search engine.
+Return ONLY the JSON array, nothing else. Example: ["query 1", "query 2"]"""
+EXTRACT_SYSTEM_MESSAGE = {"role": "system", "content": EXTRACT_SYSTEM_PROMPT}
+
+SYNTHESIS_SYSTEM_PROMPT = """You are a research assistant. Use the provided search results to answer the user's original prompt comprehensively and accurately.
+
+Requirements:
+- Base your answer ONLY on the search results provided.
+- Cite sources using [Source 1], [Source 2], etc., corresponding to the numbered sources in the context.
+- If information conflicts between sources, mention the discrepancies.
+- Provide direct, factual answers.
+- If results don't fully answer the question, clearly state what information is missing.
+- Be thorough but concise.
+- Organize your response logically, addressing your prompt directly.
+- If multiple queries were used, structure your answer to cover insights from all of them, providing a consolidated summary at the end if appropriate."""
+SYNTHESIS_SYSTEM_MESSAGE = {"role": "system", "content": SYNTHESIS_SYSTEM_PROMPT}
+
+# --- Response Cache ---
+# Nothing in memory outlives a run, even inside the server's tool worker, so search
+# results and deterministic LLM calls are cached on disk. Disabled with --no-cache.
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "web-search-tool-cache")
+CACHE_ENABLED = True
+CACHE_TTL_SECONDS = DEFAULT_CACHE_TTL
+
+def _cache_path(*key_parts) -> str:
+    """Returns the cache file for a key built from the given parts."""
+    key = json.dumps(key_parts, sort_keys=True)
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+def cache_get(path: str):
+    """Returns the cached value at path if caching is on and the entry is younger than the TTL, else None."""
+    if not CACHE_ENABLED:
+        return None
+    try:
+        if time.time() - os.path.getmtime(path) < CACHE_TTL_SECONDS:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
+    except (OSError, ValueError):
+        pass
+    return None
+
+def cache_put(path: str, value) -> None:
+    """Stores a JSON-serializable value at path; failures only cost a future cache miss."""
+    if not CACHE_ENABLED:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(value))
+        os.replace(tmp_path, path)  # atomic, so readers never see a partial file
+    except (OSError, TypeError):
+        pass
 
 # --- Helper Functions ---
 
-def call_llm(messages: List[Dict], api_url: str, model: str, api_timeout: int, max_tokens: int = 2048) -> Optional[str]:
-    """Calls the LLM API with the given messages and returns the content."""
+@functools.lru_cache(maxsize=None)
+def get_session() -> requests.Session:
+    """Returns the keep-alive session shared by SearxNG and LLM calls, built on first use."""
+    # SearxNG GETs retry on 429/5xx; the LLM POST is only retried if it never reached the server.
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504))
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry))
+    session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry))
+    return session
+
+def call_llm(messages: List[Dict], api_url: str, model: str, api_timeout: int, max_tokens: int = 2048,
+             temperature: float = 0.3, on_token: Optional[Callable[[str], None]] = None) -> Optional[str]:
+    """
+    Calls the LLM API with the given messages and returns the content.
+    Deterministic (temperature 0) calls are cached on disk by their exact request.
+    If on_token is given, it receives each piece of content as it streams in.
+    """
     payload = {
         "model": model,
         "messages": messages,
         "max_tokens": max_tokens,
-        "temperature": 0.3
+        "temperature": temperature,
+        "stream": True
     }
+    cache_path = None
+    if temperature == 0:
+        cache_path = _cache_path("llm", api_url, model, messages, max_tokens)
+        cached = cache_get(cache_path)
+        if cached is not None:
+            logger.info("Cache hit for LLM call to %s", api_url)
+            return cached
     try:
-        logger.info(f"Calling LLM at {api_url} with model {model}")
-        response = requests.post(
+        logger.info("Calling LLM at %s with model %s", api_url, model)
+        # stream=True makes api_timeout a per-chunk read limit, so a long synthesis
+        # isn't aborted while tokens are still arriving.
+        with get_session().post(
             api_url,
+            data=orjson.dumps(payload),
             headers={"Content-Type": "application/json"},
-            json=payload,
-            timeout=api_timeout
-        )
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content'].strip()
+            timeout=api_timeout,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            parts = []
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[6:]
+                if data == b"[DONE]":
+                    break
+                try:
+                    choices = orjson.loads(data).get("choices")
+                except (ValueError, AttributeError):
+                    # A malformed or keep-alive frame shouldn't abort the whole answer.
+                    logger.debug("Skipping unparseable stream chunk: %r", data)
+                    continue
+                if choices:
+                    piece = choices[0].get("delta", {}).get("content") or ""
+                    parts.append(piece)
+                    if on_token and piece:
+                        on_token(piece)
+        content = "".join(parts).strip()
+        if not content:
+            logger.error("LLM returned an empty response.")
+            return None
+        if cache_path:
+            cache_put(cache_path, content)
+        return content
     except requests.exceptions.RequestException as e:
-        logger.error(f"LLM API call failed: {e}")
+        logger.error("LLM API call failed: %s", e)
         return None
-    except (KeyError, IndexError) as e:
-        logger.error(f"Failed to parse LLM response: {e}")
+    except (ValueError, AttributeError) as e:
+        logger.error("Failed to parse LLM response: %s", e)
         return None
 
+def is_search_ready(prompt: str) -> bool:
+    """True when a prompt is already a short keyword query, so LLM optimization can be skipped."""
+    words = prompt.lower().split()
+    if len(words) > MAX_DIRECT_QUERY_WORDS or '?' in prompt:
+        return False
+    return not any(word.strip("?,.!'\"") in CONVERSATIONAL_WORDS for word in words)
+
 def optimize_search_query(prompt: str, api_url: str, model: str, api_timeout: int) -> str:
     """Converts a user prompt into an optimized short search query string."""
-    system_prompt = """Convert the user's prompt into an optimal web search query (2-16 words).
-- Use specific keywords
-- Remove conversational words ("what", "how", "can you tell me")
-- Focus on core information need
-- Include time modifiers if relevant ("today", "current", "this year")
-Return ONLY the optimized search query string."""
     messages = [
-        {"role": "system", "content": system_prompt},
+        OPTIMIZE_SYSTEM_MESSAGE,
         {"role": "user", "content": f"Original prompt: {prompt}"}
     ]
-    optimized = call_llm(messages, api_url, model, api_timeout, max_tokens=100)
+    optimized = call_llm(messages, api_url, model, api_timeout, max_tokens=100, temperature=0.0)
     if optimized:
-        return optimized.strip().strip('"').strip("'")
+        # One pass over a combined set strips whitespace and any mix of wrapping quotes.
+        return optimized.strip(' \t\r\n"\'')
     logger.warning("LLM query optimization failed, falling back to original prompt.")
     return prompt
 
 def extract_queries(prompt: str, api_url: str, model: str, api_timeout: int) -> List[str]:
     """Extracts 2-16 concise search queries from a user prompt using the LLM."""
-    system_prompt = """You are an expert at formulating effective web search queries.
-Based on the user's prompt, generate a JSON array of 2-8 concise search queries.
-Each query should be relevant and optimized for a web search engine.
-Return ONLY the JSON array, nothing else. Example: ["query 1", "query 2"]"""
     messages = [
-        {"role": "system", "content": system_prompt},
+        EXTRACT_SYSTEM_MESSAGE,
         {"role": "user", "content": f"User prompt: {prompt}"}
     ]
-    response_text = call_llm(messages, api_url, model, api_timeout, max_tokens=200)
+    response_text = call_llm(messages, api_url, model, api_timeout, max_tokens=200, temperature=0.0)
     if not response_text:
         logger.error("LLM failed to extract queries.")
         return []
 
-    # Robust JSON parsing
-    try:
-        start_idx = response_text.find('[')
-        end_idx = response_text.rfind(']')
-        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-            json_array_str = response_text[start_idx : end_idx + 1]
-            queries = json.loads(json_array_str)
-            if isinstance(queries, list) and all(isinstance(q, str) for q in queries):
-                return [q.strip() for q in queries if q.strip()]
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON from LLM response: {e}. Response was: {response_text}")
-    
-    logger.warning(f"Could not parse valid query list from LLM response: {response_text}")
+    queries = parse_query_list(response_text)
+    if queries:
+        return queries
+    logger.warning("Could not parse valid query list from LLM response: %s", response_text)
     return []
 
+def parse_query_list(response_text: str) -> List[str]:
+    """
+    Pulls the first JSON array of strings out of an LLM reply, ignoring any text
+    around it. raw_decode stops at the end of the array, so trailing brackets in
+    the prose don't matter. If no array parses, e.g. because the reply was cut at
+    max_tokens, the quoted strings after the first '[' are used instead.
+    """
+    start_idx = response_text.find('[')
+    if start_idx == -1:
+        return []
+
+    decoder = json.JSONDecoder()
+    idx = start_idx
+    while idx != -1:
+        try:
+            queries, _ = decoder.raw_decode(response_text, idx)
+        except json.JSONDecodeError:
+            queries = None
+        if isinstance(queries, list) and queries and all(isinstance(q, str) for q in queries):
+            return [q.strip() for q in queries if q.strip()]
+        idx = response_text.find('[', idx + 1)
+
+    logger.debug("No JSON array in LLM response, falling back to quoted strings: %s", response_text)
+    return [q.strip() for q in QUOTED_STRING_RE.findall(response_text, start_idx) if q.strip()]
+
+def _snippet(content: str) -> str:
+    """Cuts a result's content to MAX_RESULT_CONTENT_CHARS, marking any cut with '...'."""
+    if len(content) > MAX_RESULT_CONTENT_CHARS:
+        return content[:MAX_RESULT_CONTENT_CHARS] + '...'
+    return content
+
 def search_web(query: str, searxng_url: str, max_results: int) -> List[Dict]:
     """Performs a web search using SearxNG and returns processed results."""
-    # Construct the correct SearxNG URL based on the user's curl example
-    # Expected format: http://localhost:5003/search?q=latest+Nvidia+AI+chips+news&format=json
-    search_url = f"{searxng_url}?q={requests.utils.quote(query)}&format=json"
-    # DEBUG: Log URL construction details
-    logger.debug(f"DEBUG: Original query: '{query}'")
-    logger.debug(f"DEBUG: SearxNG URL base: '{searxng_url}'")
-    logger.debug(f"DEBUG: Encoded query: '{requests.utils.quote(query)}'")
-    logger.debug(f"DEBUG: Final search URL: '{search_url}'")
+    cache_path = _cache_path("search", searxng_url, query, max_results)
+    cached = cache_get(cache_path)
+    if cached is not None:
+        logger.info("Cache hit for query: %s", query)
+        return cached
+
+    # requests encodes the query string, giving the format SearxNG expects:
+    # http://localhost:5003/search?q=latest+Nvidia+AI+chips+news&format=json
+    params = {"q": query, "format": "json"}
     headers = {"Accept": "application/json"}
     try:
-        logger.info(f"Searching SearxNG at {search_url}")
-        response = requests.get(search_url, headers=headers, timeout=30) # Increased timeout for web search
-        logger.debug(f"Response status code: {response.status_code}")
-        logger.debug(f"Response headers: {dict(response.headers)}")
+        logger.info("Searching SearxNG at %s for query: %s", searxng_url, query)
+        response = get_session().get(searxng_url, params=params, headers=headers, timeout=30) # Increased timeout for web search
+        logger.debug("DEBUG: Final search URL: '%s'", response.url)
+        logger.debug("Response status code: %s", response.status_code)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response headers: %s", dict(response.headers))
         response.raise_for_status()
-        data = response.json()
-        logger.debug(f"Successfully parsed JSON response. Number of results: {len(data.get('results', []))}")
+        data = orjson.loads(response.content)
+        logger.debug("Successfully parsed JSON response. Number of results: %d", len(data.get('results', [])))
         results = data.get('results', [])
-        processed_results = []
-        for result in results[:max_results]:
-            if all(key in result for key in ['url', 'title', 'content']):
-                content = result.get('content', '')
-                processed_results.append({
-                    'title': result['title'],
-                    'url': result['url'],
-                    'content': content[:800] + ('...' if len(content) > 800 else ''),
-                    'published': result.get('publishedDate', 'Unknown')
-                })
-        logger.info(f"Retrieved {len(processed_results)} search results for query: {query}")
+        processed_results = [
+            {
+                'title': result['title'],
+                'url': result['url'],
+                'content': _snippet(result['content']),
+                'published': result.get('publishedDate', 'Unknown')
+            }
+            for result in results[:max_results]
+            if _REQUIRED_KEYS <= result.keys()
+        ]
+        logger.info("Retrieved %d search results for query: %s", len(processed_results), query)
+        if processed_results:
+            # Empty results are not cached so a transient SearxNG hiccup is retried next run.
+            cache_put(cache_path, processed_results)
         return processed_results
     except requests.exceptions.RequestException as e:
-        logger.error(f"Web search failed for query '{query}': {e}")
+        logger.error("Web search failed for query '%s': %s", query, e)
+        return []
+    except orjson.JSONDecodeError as e:
+        logger.error("SearxNG returned invalid JSON for query '%s': %s", query, e)
         return []
     except Exception as e:
-        logger.error(f"Unexpected error during web search: {e}")
+        logger.error("Unexpected error during web search: %s", e)
         raise
 
-def synthesize_answer(original_prompt: str, queries: List[str], results_by_query: List[Dict], api_url: str, model: str, api_timeout: int) -> str:
-    """Synthesizes a final answer from search results using the LLM."""
+def search_many(queries: List[str], searxng_url: str, max_results: int) -> List[Dict]:
+    """
+    Runs independent SearxNG searches concurrently, returning results in query order.
+    Queries that differ only in case or spacing share one request. A URL already
+    returned for an earlier query is dropped, so overlapping queries don't send
+    the same source to the LLM twice.
+    """
+    with ThreadPoolExecutor(max_workers=min(len(queries), MAX_PARALLEL_SEARCHES)) as executor:
+        inflight = {}
+        futures = []
+        for q in queries:
+            key = " ".join(q.casefold().split())
+            if key not in inflight:
+                inflight[key] = executor.submit(search_web, q, searxng_url, max_results)
+            futures.append(inflight[key])
+        results_list = [future.result() for future in futures]
+
+    seen_urls = set()
+    results_by_query = []
+    for q, results in zip(queries, results_list):
+        unique_results = []
+        for result in results:
+            if result['url'] not in seen_urls:
+                seen_urls.add(result['url'])
+                unique_results.append(result)
+        results_by_query.append({'query': q, 'results': unique_results})
+    return results_by_query
+
+def cap_sources(results_by_query: List[Dict], limit: int) -> List[Dict]:
+    """
+    Trims results to at most `limit` sources in total for the synthesis prompt.
+    Sources are taken rank by rank across queries, so every query keeps its best
+    hits instead of the first few queries using up the whole budget.
+    """
+    keep = [0] * len(results_by_query)
+    remaining = limit
+    rank = 0
+    while remaining > 0:
+        took_any = False
+        for i, query_data in enumerate(results_by_query):
+            if remaining > 0 and rank < len(query_data['results']):
+                keep[i] += 1
+                remaining -= 1
+                took_any = True
+        if not took_any:
+            break
+        rank += 1
+    return [{**query_data, 'results': query_data['results'][:n]} for query_data, n in zip(results_by_query, keep)]
+
+def fit_context_budget(results_by_query: List[Dict], budget_tokens: int) -> List[Dict]:
+    """
+    Shortens source snippets so their combined size fits roughly within budget_tokens.
+    Snippets under the fair share keep their full text and the rest of the budget
+    is split evenly over the longer ones, so no single source crowds out the others.
+    """
+    lengths = sorted(len(result['content']) for query_data in results_by_query for result in query_data['results'])
+    budget_chars = budget_tokens * CHARS_PER_TOKEN
+    if sum(lengths) <= budget_chars:
+        return results_by_query
+
+    limit = 0
+    remaining_budget = budget_chars
+    for i, length in enumerate(lengths):
+        share = remaining_budget // (len(lengths) - i)
+        if length > share:
+            limit = share
+            break
+        remaining_budget -= length
+
+    def shorten(result: Dict) -> Dict:
+        content = result['content']
+        if len(content) <= limit:
+            return result
+        return {**result, 'content': content[:limit].rstrip() + '...'}
+
+    return [{**query_data, 'results': [shorten(r) for r in query_data['results']]} for query_data in results_by_query]
+
+def synthesize_answer(original_prompt: str, queries: List[str], results_by_query: List[Dict], api_url: str, model: str,
+                      api_timeout: int, stream_output: bool = False,
+                      context_budget_tokens: int = DEFAULT_CONTEXT_BUDGET_TOKENS) -> str:
+    """
+    Synthesizes a final answer from search results using the LLM.
+    With stream_output, the answer is written to stdout as it is generated and
+    only the text still to be printed (the sources list) is returned.
+    """
     if not results_by_query or all(not rq.get('results') for rq in results_by_query):
         return "I couldn't find any relevant search results to answer your query."
 
-    context = f"User's Original Prompt: {original_prompt}\n\n"
+    # Prompt evaluation time grows with every source, so bound how many are sent.
+    results_by_query = cap_sources(results_by_query, MAX_SYNTHESIS_SOURCES)
+    results_by_query = fit_context_budget(results_by_query, context_budget_tokens)
+    parts = [f"User's Original Prompt: {original_prompt}\n\n"]
     source_idx = 1
     for i, query_data in enumerate(results_by_query):
-        query = query_data['query']
-        results = query_data['results']
-        context += f"Search Query {i+1}: {query}\n"
-        context += "-" * 40 + "\n"
-        if results:
-            for result in results:
-                context += f"Source [{source_idx}]:\n"
-                context += f"  Title: {result['title']}\n"
-                context += f"  URL: {result['url']}\n"
-                context += f"  Published: {result['published']}\n"
-                context += f"  Content: {result['content']}\n\n"
+        parts.append(f"Search Query {i+1}: {query_data['query']}\n{'-' * 40}\n")
+        if query_data['results']:
+            for result in query_data['results']:
+                parts.append(
+                    f"Source [{source_idx}]:\n"
+                    f"  Title: {result['title']}\n"
+                    f"  URL: {result['url']}\n"
+                    f"  Published: {result['published']}\n"
+                    f"  Content: {result['content']}\n\n"
+                )
                 source_idx += 1
         else:
-            context += "  No results found for this query.\n\n"
-    
-    system_prompt = """You are a research assistant. Use the provided search results to answer the user's original prompt comprehensively and accurately.
+            parts.append("  No results found for this query.\n\n")
+    context = "".join(parts)
 
-Requirements:
-- Base your answer ONLY on the search results provided.
-- Cite sources using [Source 1], [Source 2], etc., corresponding to the numbered sources in the context.
-- If information conflicts between sources, mention the discrepancies.
-- Provide direct, factual answers.
-- If results don't fully answer the question, clearly state what information is missing.
-- Be thorough but concise.
-- Organize your response logically, addressing your prompt directly.
-- If multiple queries were used, structure your answer to cover insights from all of them, providing a consolidated summary at the end if appropriate."""
-    
     messages = [
-        {"role": "system", "content": system_prompt},
+        SYNTHESIS_SYSTEM_MESSAGE,
         {"role": "user", "content": context}
     ]
     # DEBUG: Log LLM synthesis details
-    logger.debug(f"DEBUG: Starting LLM synthesis for {len(queries)} queries")
-    logger.debug(f"DEBUG: Total search results across all queries: {sum(len(rq.get('results', [])) for rq in results_by_query)}")
-    logger.debug(f"DEBUG: Context length for LLM: {len(context)} characters")
-    logger.debug(f"DEBUG: LLM API URL: {api_url}")
-    logger.debug(f"DEBUG: LLM Model: {model}")
-    logger.debug(f"DEBUG: Sending LLM synthesis request...")
-    answer = call_llm(messages, api_url, model, api_timeout, max_tokens=4000)
-    logger.debug(f"DEBUG: LLM synthesis call completed. Answer received: {bool(answer)}")
-    logger.debug(f"DEBUG: Answer length: {len(answer) if answer else 0} characters")
-    logger.debug(f"DEBUG: LLM Max Tokens: {api_timeout}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("DEBUG: Starting LLM synthesis for %d queries", len(queries))
+        logger.debug("DEBUG: Total search results across all queries: %d", sum(len(rq.get('results', [])) for rq in results_by_query))
+        logger.debug("DEBUG: Context length for LLM: %d characters", len(context))
+        logger.debug("DEBUG: LLM API URL: %s", api_url)
+        logger.debug("DEBUG: LLM Model: %s", model)
+        logger.debug("DEBUG: Sending LLM synthesis request...")
+    started = False
+
+    def write_token(piece: str) -> None:
+        """Writes a token to stdout immediately, dropping the model's leading whitespace."""
+        nonlocal started
+        if not started:
+            piece = piece.lstrip()
+            if not piece:
+                return
+            started = True
+        sys.stdout.write(piece)
+        sys.stdout.flush()
+
+    answer = call_llm(messages, api_url, model, api_timeout, max_tokens=4000,
+                      on_token=write_token if stream_output else None)
+    logger.debug("DEBUG: LLM synthesis call completed. Answer received: %s", bool(answer))
+    logger.debug("DEBUG: Answer length: %d characters", len(answer) if answer else 0)
+    logger.debug("DEBUG: LLM API timeout: %s", api_timeout)
     
+    # Append sources list
+    urls = (result['url'] for query_data in results_by_query for result in query_data['results'])
+    sources_section = "\n\nSources:\n" + "".join(f"[{idx}] {url}\n" for idx, url in enumerate(urls, 1))
+
     if not answer:
+        if started:
+            # Part of the answer is already on stdout; mark where it stopped instead of
+            # appending a message that claims nothing was produced.
+            return "\n[stream interrupted: LLM error]" + sources_section
         return "I was unable to synthesize the search results into a coherent answer due to an LLM error."
-    
-    # Append sources list
-    sources_section = "\n\nSources:\n"
-    current_source_idx = 1
-    for query_data in results_by_query:
-        for result in query_data['results']:
-            sources_section += f"[{current_source_idx}] {result['url']}\n"
-            current_source_idx += 1
-            
-    return answer + sources_section
+
+    return sources_section if stream_output else answer + sources_section
 
 # --- Main Execution Logic ---
 
@@ -235,24 +494,42 @@ def main():
                         help="LLM API endpoint for chat completions.")
     parser.add_argument("--model", type=str, default=os.getenv("MODEL_NAME", DEFAULT_MODEL_NAME),
                         help="LLM model identifier.")
+    parser.add_argument("--always-optimize", action="store_true",
+                        help="In single mode, send every prompt through LLM query optimization, even short keyword ones.")
+    parser.add_argument("--context-budget-tokens", type=int,
+                        default=int(os.getenv("CONTEXT_BUDGET_TOKENS", DEFAULT_CONTEXT_BUDGET_TOKENS)),
+                        help="Approximate token budget for search snippets sent to answer synthesis.")
+    parser.add_argument("--cache-ttl", type=int, default=int(os.getenv("SEARCH_CACHE_TTL", DEFAULT_CACHE_TTL)),
+                        help="Seconds a cached search result or LLM response stays valid.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and bypass the on-disk response cache.")
     parser.add_argument("input", nargs="*", help="User input prompt or queries.")
     
     args = parser.parse_args()
+
+    global CACHE_ENABLED, CACHE_TTL_SECONDS
+    CACHE_ENABLED = not args.no_cache and args.cache_ttl > 0
+    CACHE_TTL_SECONDS = args.cache_ttl
     prompt_str = " ".join(args.input).strip()
 
     if not prompt_str:
         print(json.dumps({"success": False, "error": "Empty input"}))
         sys.exit(1)
 
-    logger.info(f"Mode: {args.mode}, Input: {prompt_str[:100]}...")
+    logger.info("Mode: %s, Input: %s...", args.mode, prompt_str[:100])
 
     try:
         if args.mode == 'single':
-            query = optimize_search_query(prompt_str, args.api_url, args.model, args.api_timeout)
-            logger.info(f"Optimized query for single mode: {query}")
+            if not args.always_optimize and is_search_ready(prompt_str):
+                # Saves an LLM round-trip that would likely return the prompt unchanged.
+                query = prompt_str
+                logger.info("Using prompt directly as query for single mode: %s", query)
+            else:
+                query = optimize_search_query(prompt_str, args.api_url, args.model, args.api_timeout)
+                logger.info("Optimized query for single mode: %s", query)
             results = search_web(query, args.searxng_url, args.max_results)
             results_by_query = [{'query': query, 'results': results}]
-            final_answer = synthesize_answer(prompt_str, [query], results_by_query, args.api_url, args.model, args.api_timeout)
+            final_answer = synthesize_answer(prompt_str, [query], results_by_query, args.api_url, args.model, args.api_timeout,
+                                             stream_output=True, context_budget_tokens=args.context_budget_tokens)
             print(final_answer)
 
         elif args.mode == 'queue':
@@ -266,14 +543,12 @@ def main():
                 print(json.dumps({"success": False, "error": "No queries found after splitting input."}))
                 sys.exit(1)
             
-            logger.info(f"Queued queries: {queries}")
-            all_results = []
-            for q in queries:
-                # No optimization for queued searches, assume user provides good queries
-                results = search_web(q, args.searxng_url, args.max_results)
-                all_results.append({'query': q, 'results': results})
+            logger.info("Queued queries: %s", queries)
+            # No optimization for queued searches, assume user provides good queries
+            all_results = search_many(queries, args.searxng_url, args.max_results)
             
-            final_answer = synthesize_answer(prompt_str, queries, all_results, args.api_url, args.model, args.api_timeout)
+            final_answer = synthesize_answer(prompt_str, queries, all_results, args.api_url, args.model, args.api_timeout,
+                                             stream_output=True, context_budget_tokens=args.context_budget_tokens)
             print(final_answer)
 
         elif args.mode == 'extract':
@@ -282,17 +557,15 @@ def main():
                 print(json.dumps({"success": False, "error": "Failed to extract search queries from prompt."}))
                 sys.exit(1)
             
-            logger.info(f"Extracted queries: {extracted_queries}")
-            all_results = []
-            for q in extracted_queries:
-                results = search_web(q, args.searxng_url, args.max_results)
-                all_results.append({'query': q, 'results': results})
+            logger.info("Extracted queries: %s", extracted_queries)
+            all_results = search_many(extracted_queries, args.searxng_url, args.max_results)
             
-            final_answer = synthesize_answer(prompt_str, extracted_queries, all_results, args.api_url, args.model, args.api_timeout)
+            final_answer = synthesize_answer(prompt_str, extracted_queries, all_results, args.api_url, args.model, args.api_timeout,
+                                             stream_output=True, context_budget_tokens=args.context_budget_tokens)
             print(final_answer)
 
     except Exception as e:
-        logger.error(f"An unhandled error occurred: {e}", exc_info=True)
+        logger.error("An unhandled error occurred: %s", e, exc_info=True)
         print(json.dumps({"success": False, "error": f"An unexpected error occurred: {str(e)}"}))
         sys.exit(1)
 